@@ -91,6 +91,35 @@ gr_compilation.add_argument('--build_jobs',
 	default = multiprocessing.cpu_count(),
 	help    = "Number of build threads"
 )
+gr_compilation.add_argument('--build_load_limit',
+	default = 0,
+	type    = float,
+	help    = "Don't start new jobs while the load average is above this (make / ninja -l), 0 - no limit"
+)
+gr_compilation.add_argument('--compiler_cache',
+	default = 'none',
+	choices = {'none', 'auto', 'ccache', 'sccache'},
+	help    = "Compiler cache for Blender and the dependencies (auto - first one found)"
+)
+gr_compilation.add_argument('--compiler_cache_dir',
+	default = '',
+	help    = "Compiler cache directory (default: the cache tool's own)",
+	metavar = 'DIR'
+)
+gr_compilation.add_argument('--compiler_cache_size',
+	default = '',
+	help    = "Compiler cache size limit, for example 20G (default: the cache tool's own)"
+)
+gr_compilation.add_argument('--linker',
+	default = 'auto',
+	choices = {'auto', 'bfd', 'gold', 'lld'},
+	help    = "Linker (Linux only), auto - the fastest one the compiler supports"
+)
+gr_compilation.add_argument('--debug_info',
+	default = 'inline',
+	choices = {'inline', 'split', 'separate'},
+	help    = "Debug info (Linux only): inline, split - split DWARF (.dwo files, not processed by the linker), separate - moved out of the installed binaries"
+)
 gr_compilation.add_argument('--vc_from_env',
 	dest    = "use_env_msvc",
 	action  = 'store_true',
@@ -185,7 +214,34 @@ gr_src.add_argument(
 	'--github-exp-branch',
 	dest    = "use_exp_branch",
 	default = "master",
-	help    = "Use exporter from specific branch"
+	help    = "Use exporter from specific branch (installed as a copy without .git, the checkout is in dir_source/vray_for_blender_exporter)"
+)
+gr_src.add_argument('--git_depth',
+	default = 0,
+	type    = int,
+	help    = "Clone Blender and exporter sources with this history depth, 0 - full history"
+)
+gr_src.add_argument('--git_filter',
+	default = '',
+	help    = "Partial clone filter for Blender and exporter sources, for example blob:none"
+)
+gr_src.add_argument('--git_unshallow_count',
+	action  = 'store_true',
+	help    = "Fetch the commit history of a shallow clone to get the exact commit count (slow on big repos)"
+)
+gr_src.add_argument('--commit_count',
+	default = '',
+	help    = "Commit count of the Blender sources as known by the build server, skips counting"
+)
+gr_src.add_argument('--git_jobs',
+	default = 4,
+	type    = int,
+	help    = "Number of submodules updated at the same time"
+)
+gr_src.add_argument('--export_mode',
+	default = 'copy',
+	choices = {'worktree', 'copy'},
+	help    = "How blender-git is exported to blender: git worktree (only changed files are touched) or full copy"
 )
 gr_src.add_argument(
 	'--use_blender_hash',
@@ -205,6 +261,35 @@ gr_deps.add_argument('--install_deps',
 	default = False,
 	help="Install dependencies (Gentoo, OpenSuse, Fedora, Ubuntu)"
 )
+gr_deps.add_argument('--deps_parallel',
+	default = 0,
+	type    = int,
+	help    = "Number of libraries to build at the same time, 0 - auto (jobs are split between them)"
+)
+gr_deps.add_argument('--deps_download_cache',
+	default = '',
+	help    = "Directory for downloaded dependency sources (default: ~/blender-libs-downloads)",
+	metavar = 'FILE'
+)
+gr_deps.add_argument('--deps_mirror',
+	default = '',
+	help    = "Mirror (url prefix or local directory) tried before the original download urls, files are looked up as <sha1(url)[:12]>-<name> (the download cache naming), then as <name>"
+)
+gr_deps.add_argument('--deps_download_jobs',
+	default = 4,
+	type    = int,
+	help    = "Number of dependency sources downloaded at the same time"
+)
+gr_deps.add_argument('--deps_bundle_export',
+	default = '',
+	help    = "Pack the built dependencies into a bundle (.tar.gz / .tar.xz) and exit",
+	metavar = 'FILE'
+)
+gr_deps.add_argument('--deps_bundle_import',
+	default = '',
+	help    = "Unpack and verify a dependencies bundle before building the dependencies",
+	metavar = 'FILE'
+)
 
 
 gr_script = parser.add_argument_group(title="Build Script Debug")
@@ -24,7 +24,9 @@
 
 
 import os
-import re
+import json
+import collections
+import hashlib
 import sys
 import shutil
 import tempfile
@@ -40,6 +42,84 @@ GITHUB_REPO   = "https://github.com/ChaosGroup/blender_with_vray_additions"
 
 BLENDER_HASH_271 = "772af36fc469e7666fc59d1d0b0e4dbcf52cfe2c"
 
+# Number of patched trees (vray_for_blender-cache/* branches and patches) kept
+PATCH_CACHE_KEEP = 4
+
+# Rough peak memory of a single Blender compile job in MB
+BLENDER_PEAK_RSS_MB = 1024
+
+CONFIGURE_FINGERPRINT_FILE = "vb-configure.fingerprint"
+CMAKE_INITIAL_CACHE_FILE = "vb-initial-cache.cmake"
+
+# Post build compile time report in dir_build, the history has one line per build
+NINJA_SUMMARY_FILE = "ninja-build-summary.json"
+NINJA_HISTORY_FILE = "ninja-build-history.jsonl"
+
+# Contents hash and mtime of the overlaid datafiles of the previous build, in dir_build
+DATAFILES_STAMP_FILE = "vb-datafiles.json"
+
+# Environment cmake reads while configuring
+CONFIGURE_ENV_VARS = (
+	'PATH', 'CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'LDFLAGS', 'CPPFLAGS',
+	'INCLUDE', 'LIB', 'LIBPATH', 'MACOSX_DEPLOYMENT_TARGET', 'SDKROOT',
+	'CMAKE_PREFIX_PATH', 'PKG_CONFIG_PATH',
+	'CMAKE_C_COMPILER_LAUNCHER', 'CMAKE_CXX_COMPILER_LAUNCHER',
+	'CGR_APPSDK_PATH', 'CGR_APPSDK_VERSION', 'CGR_BUILD_TYPE',
+)
+
+
+class CMakeCache:
+	"""
+	  Cache variables of the Blender configure, written to an initial cache
+	  file for 'cmake -C' instead of passing them as -D arguments.
+	"""
+
+	def __init__(self, variables=None):
+		self.variables = collections.OrderedDict()
+		if variables:
+			self.update(variables)
+
+
+	def set(self, name, value):
+		"""Booleans are stored as ON / OFF, everything else as a string"""
+		self.variables[name] = value
+
+
+	def unset(self, name):
+		"""Leave name to the cmake default"""
+		self.variables.pop(name, None)
+
+
+	def update(self, variables):
+		for name in variables:
+			self.set(name, variables[name])
+
+
+	def text(self):
+		def quote(value):
+			return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+
+		lines = ['# Generated by the V-Ray/Blender build system, used as: cmake -C <this file>']
+		for name, value in self.variables.items():
+			if isinstance(value, bool):
+				# FORCE, so a changed value replaces the one in CMakeCache.txt like -D does
+				lines.append('set(%s %s CACHE BOOL "" FORCE)' % (name, utils.GetCmakeOnOff(value)))
+			else:
+				lines.append('set(%s %s CACHE STRING "" FORCE)' % (name, quote(str(value))))
+		lines.append('')
+		return '\n'.join(lines)
+
+
+	def write(self, path):
+		"""Write the file if its contents changed, returns the path"""
+		text = self.text()
+		if os.path.exists(path):
+			with open(path, 'r') as f:
+				if f.read() == text:
+					return path
+		utils.write_file_atomic(path, text)
+		return path
+
 
 class Builder:
 	"""
@@ -56,6 +136,13 @@ class Builder:
 		self.revision       = utils.REVISION
 		self.brev           = ""
 		self.commits        = '0'
+		self.revision_info  = {
+			'revision'   : self.revision,
+			'brev'       : self.brev,
+			'commits'    : self.commits,
+			'version'    : self.version,
+			'versionArr' : utils.get_blender_version(''),
+		}
 
 		# Installation diractory name
 		self.dir_install_name = "vrayblender"
@@ -152,7 +239,7 @@ class Builder:
 		  Getting/updating sources
 		"""
 
-		def exportSources():
+		def exportSourcesCopy():
 			sys.stdout.write("Exporting sources...\n")
 			if self.mode_test:
 				return
@@ -165,12 +252,46 @@ class Builder:
 
 			# Update patched branch
 			os.chdir(self.dir_blender)
-			os.system("git remote update github")
+			os.system("git fetch %sgithub" % utils.get_git_clone_args(self.git_depth, self.git_filter))
 			os.system("git checkout -b {branch} github/{branch}".format(branch=self.use_github_branch))
 
+		def exportSourcesWorktree():
+			sys.stdout.write("Exporting sources (git worktree)...\n")
+			if self.mode_test:
+				return
+
+			if not utils.is_git_worktree_of(self.dir_blender, self.dir_blender_svn):
+				if os.path.exists(self.dir_blender):
+					utils.remove_directory(self.dir_blender)
+				os.chdir(self.dir_blender_svn)
+				os.system("git worktree prune")
+				os.system("git worktree add --detach %s" % self.dir_blender)
+
+			# Checkout rewrites only the files that differ, the rest
+			# keep their mtimes and are not recompiled
+			os.chdir(self.dir_blender)
+			os.system("git fetch %sgithub" % utils.get_git_clone_args(self.git_depth, self.git_filter))
+			utils.git_release_skip_worktree(self.dir_blender, "github/%s" % self.use_github_branch)
+			# Detached: the branch may be checked out in blender-git, which
+			# shares its branches with the worktree
+			os.system("git checkout -f --detach github/{branch}".format(branch=self.use_github_branch))
+			os.system("git clean -fd")
+
+			# Clone submodules from the ones in blender-git instead of the network
+			modulesDir = os.path.join(self.dir_blender_svn, '.git', 'modules')
+			config = ['-c protocol.file.allow=always']
+			for name, path in utils.get_git_submodules(self.dir_blender):
+				if os.path.isdir(os.path.join(modulesDir, name)):
+					config.append('-c submodule.%s.url=%s' % (name, os.path.join(modulesDir, name)))
+			utils.update_git_submodules(self.dir_blender, jobs=self.git_jobs, git_config=' '.join(config), log_prefix='blender')
+			utils.foreach_git_submodule(self.dir_blender, "git -c protocol.file.allow=always fetch -q origin && git checkout -q -f -B master origin/master",
+										jobs=self.git_jobs, log_prefix='blender')
+
+		exportSources = exportSourcesWorktree if self.export_mode == 'worktree' else exportSourcesCopy
+
 		# Update Blender sources
 		if self.upblender == "on":
-			if os.path.exists(self.dir_blender):
+			if self.export_mode == 'copy' and os.path.exists(self.dir_blender):
 				sys.stdout.write("Removing exported sources...\n")
 				if not self.mode_test:
 					utils.remove_directory(self.dir_blender)
@@ -181,7 +302,7 @@ class Builder:
 					os.chdir(self.dir_source)
 
 					# Obtain sources
-					os.system("git clone %s blender-git" % GITHUB_REPO)
+					os.system("git clone %s%s blender-git" % (utils.get_git_clone_args(self.git_depth, self.git_filter), GITHUB_REPO))
 					os.chdir(self.dir_blender_svn)
 
 					# Change remotes for correct submodule init
@@ -189,9 +310,10 @@ class Builder:
 					os.system("git remote add github %s" % GITHUB_REPO)
 
 					# Init submodules
-					os.system("git submodule update --init --recursive")
-					os.system("git submodule foreach git checkout master")
-					os.system("git submodule foreach git pull --rebase origin master")
+					utils.update_git_submodules(self.dir_blender_svn, jobs=self.git_jobs,
+												args=utils.get_git_clone_args(self.git_depth, self.git_filter), log_prefix='blender-git')
+					utils.foreach_git_submodule(self.dir_blender_svn, "git checkout master && git pull --rebase origin master",
+												jobs=self.git_jobs, log_prefix='blender-git')
 
 			else:
 				sys.stdout.write("Updating Blender sources...\n")
@@ -199,7 +321,8 @@ class Builder:
 					os.chdir(self.dir_blender_svn)
 
 					# Update submodules
-					os.system("git submodule foreach git pull --rebase origin master")
+					utils.foreach_git_submodule(self.dir_blender_svn, "git pull --rebase origin master",
+												jobs=self.git_jobs, log_prefix='blender-git')
 
 			exportSources()
 
@@ -221,61 +344,211 @@ class Builder:
 
 	def update(self):
 		if self.teamcity:
-			self.revision = self.teamcity_branch_hash
-			self.brev = utils._get_cmd_output(['git', 'ls-remote', GITHUB_REPO, 'master'])
-			self.brev = re.split('\s+', self.brev)[0][:7]
-			self.commits = ""
+			info = dict(utils.get_revision_info(self.dir_blender, from_git=False))
+			info.update({
+				'revision' : self.teamcity_branch_hash,
+				'brev'     : utils.get_remote_branch_hash(GITHUB_REPO, 'master')[:7],
+				'commits'  : "",
+			})
 		else:
-			self.revision, self.brev, self.commits = utils.get_svn_revision(self.dir_blender)
+			# The count is kept in blender-git, the copy export recreates dir_blender
+			info = utils.get_revision_info(self.dir_blender, commit_count=self.commit_count, unshallow=self.git_unshallow_count,
+										   count_root=self.dir_blender_svn)
 
-		self.version = utils.get_blender_version(self.dir_blender)[0]
-		self.versionArr = utils.get_blender_version(self.dir_blender)
+		self.revision_info = info
+		self.revision   = info['revision']
+		self.brev       = info['brev']
+		self.commits    = info['commits']
+		self.version    = info['version']
+		self.versionArr = info['versionArr']
 
 		self.dir_install_name = utils.GetInstallDirName(self)
 		self.dir_install_path = utils.path_join(self.dir_install, self.dir_install_name)
 
 
 	def patch(self):
-		patch_dir = self.patch_dir
-
 		if self.use_blender_hash:
-			patchBin      = utils.find_patch()
-			patchFilepath = os.path.join(tempfile.gettempdir(), "vray_for_blender.patch")
+			self.patch_blender_hash()
 
-			os.chdir(self.dir_blender)
+		# Add datafiles: splash, default scene etc
+		sys.stdout.write("Adding datafiles...\n")
+
+		if not self.mode_test:
+			self.overlay_datafiles()
 
-			os.system("git checkout %s" % self.use_github_branch) # Checkout exporter branch
-			os.system("git diff master > %s" % patchFilepath)     # Generate diff with master
-			os.system("git fetch --tags")                         # Hash could be tag also
-			os.system("git checkout %s" % self.use_blender_hash)  # Checkout needed revision
-			os.system("git checkout -b vray_for_blender")         # Create some branch for patching
-			os.system("patch -Np1 -i %s" % patchFilepath)         # Apply patch
 
-			os.remove(patchFilepath)
+	def overlay_datafiles(self):
+		""" Overlay splash and icons from the patch on release/datafiles.
+		Only files with different contents are written, and a file with the same
+		contents as the previous overlay gets its previous mtime back (the copy
+		export rewrites the whole tree), so an unchanged rebuild doesn't
+		regenerate and recompile the datatoc sources
+		"""
+		datafiles_src = utils.path_join(self.patch_dir, "datafiles")
+		datafiles_dst = utils.path_join(self.dir_blender, "release", "datafiles")
+
+		overlay = []
+		for splash_filename in ["splash.png", "splash_2x.png"]:
+			overlay.append(splash_filename)
+		for subdir in ["blender_icons16", "blender_icons32"]:
+			for fileName in sorted(os.listdir(utils.path_join(datafiles_src, subdir))):
+				overlay.append(os.path.join(subdir, fileName))
+
+		stampPath = os.path.join(self.dir_build, DATAFILES_STAMP_FILE)
+		previous = {}
+		if os.path.exists(stampPath):
+			try:
+				with open(stampPath) as f:
+					previous = json.load(f)
+			except ValueError:
+				previous = {}
+
+		# Written files get the current mtime, so the build notices the change,
+		# unless the contents are the ones the previous build has seen
+		stamp = {}
+		changed = 0
+		for f in overlay:
+			dst = os.path.join(datafiles_dst, f)
+			utils.copy_if_changed(os.path.join(datafiles_src, f), dst, keep_mtime=False)
+			sha = utils.file_sha256(dst)
+			if f in previous and previous[f][0] == sha:
+				os.utime(dst, (previous[f][1], previous[f][1]))
+			else:
+				changed += 1
+			stamp[f] = (sha, os.path.getmtime(dst))
+		sys.stdout.write("Datafiles: %i of %i changed\n" % (changed, len(overlay)))
+
+		os.makedirs(self.dir_build, exist_ok=True)
+		with open(stampPath + '.tmp', 'w') as f:
+			json.dump(stamp, f, indent=1, sort_keys=True)
+		os.replace(stampPath + '.tmp', stampPath)
+
+		# Keep the overlaid files out of the way of the worktree checkout,
+		# otherwise every export resets them and they are written again
+		if self.export_mode == 'worktree' and utils.is_git_worktree_of(self.dir_blender, self.dir_blender_svn):
+			paths = [os.path.join("release", "datafiles", f) for f in overlay]
+			tracked = utils._get_cmd_output(['git', 'ls-files', '--'] + paths, self.dir_blender).splitlines()
+			if tracked:
+				subprocess.call(['git', 'update-index', '-q', '--skip-worktree', '--'] + tracked, cwd=self.dir_blender)
+
+
+	def patch_blender_hash(self):
+		""" Put the exporter changes (branch diff with master) on top of self.use_blender_hash.
+		Both the diff and the patched tree are cached, keyed by (branch head, master, target hash):
+		the diff as a file in the git dir, the tree as a vray_for_blender-cache/* branch.
+		Both are kept in blender-git, which survives the export (the copy export
+		recreates dir_blender every run). Only the PATCH_CACHE_KEEP most recently
+		used entries are kept
+		"""
+		def git(*args):
+			return utils._get_cmd_output_ex(['git'] + list(args), self.dir_blender)
+
+		os.chdir(self.dir_blender)
+
+		# The worktree export doesn't create a local branch
+		branchHead = git('rev-parse', '--verify', 'github/%s^{commit}' % self.use_github_branch)
+		if branchHead['code']:
+			branchHead = git('rev-parse', '--verify', '%s^{commit}' % self.use_github_branch)
+		branchHead = branchHead['output']
+
+		# Hash could be tag also, fetch tags only if it's not known yet
+		target = git('rev-parse', '--verify', '%s^{commit}' % self.use_blender_hash)
+		if target['code']:
+			git('fetch', '--tags')
+			target = git('rev-parse', '--verify', '%s^{commit}' % self.use_blender_hash)
+			if target['code']:
+				sys.stderr.write("Unknown Blender revision: %s\n" % self.use_blender_hash)
+				sys.exit(1)
+		targetHash = target['output']
+
+		# The patch is the diff against the local master, it changes with it
+		masterHash = git('rev-parse', '--verify', 'master^{commit}')['output']
+
+		cacheKey    = "%s-%s-%s" % (branchHead[:12], masterHash[:12], targetHash[:12])
+		cacheBranch = "vray_for_blender-cache/%s" % cacheKey
+
+		cacheRepo = self.dir_blender_svn
+		gitDir, commonDir = utils.get_git_dirs(cacheRepo)
+		if commonDir is None:
+			cacheRepo = self.dir_blender
+			gitDir, commonDir = utils.get_git_dirs(cacheRepo)
+		# The worktree export shares the refs with blender-git, the copy has its own
+		sharedRefs = commonDir == utils.get_git_dirs(self.dir_blender)[1]
+
+		patchCacheDir = os.path.join(commonDir, 'vb-patch-cache')
+		patchFilepath = os.path.join(patchCacheDir, "%s.patch" % cacheKey)
+
+		cached = utils._get_cmd_output_ex(['git', 'rev-parse', '--verify', '--quiet', 'refs/heads/%s' % cacheBranch], cacheRepo)
+		if cached['code'] == 0:
+			sys.stdout.write("Using cached patched tree %s\n" % cacheBranch)
+			if not sharedRefs:
+				git('fetch', '-q', cacheRepo, '+refs/heads/%s:refs/heads/%s' % (cacheBranch, cacheBranch))
+			utils.git_release_skip_worktree(self.dir_blender, cacheBranch)
+			git('checkout', '-f', '-B', 'vray_for_blender', cacheBranch)
+			if os.path.exists(patchFilepath):
+				os.utime(patchFilepath)
+			self.prune_patch_cache(cacheRepo, patchCacheDir, cacheKey)
+			return
 
-		# Add datafiles: splash, default scene etc
-		sys.stdout.write("Adding datafiles...\n")
+		if not os.path.exists(patchFilepath):
+			os.makedirs(patchCacheDir, exist_ok=True)
+			diff = subprocess.check_output(['git', 'diff', '--binary', 'master', branchHead], cwd=self.dir_blender)
+			with open(patchFilepath + '.tmp', 'wb') as f:
+				f.write(diff)
+			os.replace(patchFilepath + '.tmp', patchFilepath)
+		else:
+			sys.stdout.write("Using cached patch %s\n" % patchFilepath)
+			os.utime(patchFilepath)
+
+		utils.git_release_skip_worktree(self.dir_blender, targetHash)
+		git('checkout', '-f', '-B', 'vray_for_blender', targetHash)
+
+		# Three-way apply: hunks that don't match exactly are merged and reported,
+		# conflicts fail the build instead of leaving half applied sources
+		apply = subprocess.run(['git', 'apply', '--3way', '--index', patchFilepath],
+			cwd=self.dir_blender, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		applyLog = apply.stdout.decode(errors='replace')
+		for line in applyLog.splitlines():
+			if 'three-way' in line or 'conflict' in line.lower() or line.startswith('error'):
+				sys.stdout.write("patch: %s\n" % line)
+		if apply.returncode:
+			sys.stderr.write("Patch %s does not apply on %s!\n" % (patchFilepath, self.use_blender_hash))
+			sys.exit(1)
+
+		git('-c', 'user.name=vb-builder', '-c', 'user.email=vb-builder@localhost',
+			'commit', '-q', '--no-verify', '-m', "V-Ray For Blender changes from %s" % self.use_github_branch)
+		if sharedRefs:
+			git('branch', '-f', cacheBranch, 'HEAD')
+		else:
+			git('push', '-q', '-f', cacheRepo, 'HEAD:refs/heads/%s' % cacheBranch)
 
-		datafiles_path = utils.path_join(self.dir_blender, "release", "datafiles")
+		self.prune_patch_cache(cacheRepo, patchCacheDir, cacheKey)
 
-		if not self.mode_test:
-			# Change splash
-			for splash_filename in ["splash.png", "splash_2x.png"]:
-				splash_path_src = utils.path_join(patch_dir, "datafiles", splash_filename)
-				splash_path_dst = utils.path_join(datafiles_path, splash_filename)
 
-				shutil.copyfile(splash_path_src, splash_path_dst)
+	def prune_patch_cache(self, cacheRepo, patchCacheDir, currentKey):
+		""" Drop patch cache entries beyond the PATCH_CACHE_KEEP most recently used ones
+		from cacheRepo. The patch file mtime is the use time, a cache branch goes with its patch
+		"""
+		patches = []
+		if os.path.isdir(patchCacheDir):
+			for entry in os.listdir(patchCacheDir):
+				if entry.endswith('.patch'):
+					filepath = os.path.join(patchCacheDir, entry)
+					patches.append((os.path.getmtime(filepath), entry[:-len('.patch')]))
+		patches.sort(reverse=True)
 
-			# Change icons
-			for subdir in ["blender_icons16", "blender_icons32"]:
-				icons_path_src = utils.path_join(patch_dir, "datafiles", subdir)
-				icons_path_dst = utils.path_join(datafiles_path, subdir)
+		keep = set([currentKey] + [key for mtime, key in patches[:PATCH_CACHE_KEEP]])
 
-				for fileName in os.listdir(icons_path_src):
-					iconFilepathSrc = os.path.join(icons_path_src, fileName)
-					iconFilepathDst = os.path.join(icons_path_dst, fileName)
+		for mtime, key in patches:
+			if key not in keep:
+				os.remove(os.path.join(patchCacheDir, "%s.patch" % key))
 
-					shutil.copyfile(iconFilepathSrc, iconFilepathDst)
+		branches = utils._get_cmd_output_ex(['git', 'for-each-ref', '--format=%(refname:short)',
+			'refs/heads/vray_for_blender-cache/'], cacheRepo)
+		for branch in branches['output'].splitlines():
+			if branch.split('/', 1)[1] not in keep:
+				sys.stdout.write("Removing old patch cache %s\n" % branch)
+				utils._get_cmd_output_ex(['git', 'branch', '-D', branch], cacheRepo)
 
 
 	def clean_prebuilt_libs(self):
@@ -350,13 +623,19 @@ class Builder:
 		if self.jenkins:
 			wd = os.path.join(prefix, 'builds')
 
+		downloads = self.deps_download_cache
+		if downloads == '':
+			downloads = os.path.expanduser('~/blender-libs-downloads')
+
 		utils.stdout_log('Blender libs build dir [%s]' % wd)
 		utils.stdout_log('Blender libs install dir [%s]' % prefix)
+		utils.stdout_log('Blender libs download cache [%s]' % downloads)
 
 		if not os.path.isdir(wd):
 			os.makedirs(wd)
 
 		self._blender_libs_wd = wd
+		self._blender_libs_downloads = downloads
 		self._blender_libs_location = prefix
 		return prefix
 
@@ -388,6 +667,217 @@ class Builder:
 		sys.stderr.write("Base class method called: package() This souldn't happen.\n")
 
 
+	def get_ninja_jobs_args(self):
+		"""-j (limited by the available memory) and -l arguments for ninja"""
+		jobs = utils.plan_jobs(self.build_jobs, BLENDER_PEAK_RSS_MB)
+		if jobs < int(self.build_jobs):
+			utils.stdout_log('Limiting build jobs %s -> %d because of the available memory' % (self.build_jobs, jobs))
+
+		args = ['-j%s' % jobs]
+		if self.build_load_limit:
+			args.append('-l%s' % self.build_load_limit)
+		return args
+
+
+	def get_configure_fingerprint(self, cmake):
+		"""Hash of everything a cmake configure depends on apart from the sources:
+		the arguments, the cmake and compiler binaries and the toolchain environment"""
+		if self.host_os == utils.WIN:
+			compilers = ['cl']
+		elif self.host_os == utils.MAC:
+			compilers = ['clang', 'clang++']
+		else:
+			compilers = [self.gcc or os.environ.get('CC', 'cc'), self.gxx or os.environ.get('CXX', 'c++')]
+
+		tools = {}
+		for tool in [cmake[0], 'ninja'] + compilers:
+			path = shutil.which(tool)
+			if path:
+				st = os.stat(path)
+				tools[tool] = [os.path.realpath(path), st.st_size, st.st_mtime]
+			else:
+				tools[tool] = None
+
+		env = {var: os.environ.get(var) for var in CONFIGURE_ENV_VARS}
+
+		data = json.dumps({'args': cmake, 'tools': tools, 'env': env}, sort_keys=True)
+		return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+	def get_cmake_cache(self):
+		"""Cache variables common to all platforms"""
+		cache = CMakeCache()
+		cache.set("CMAKE_BUILD_TYPE", self.build_type.capitalize())
+		# Stable, so a new revision doesn't change the configure fingerprint,
+		# install_build() installs to the per revision dir_install_path
+		cache.set("CMAKE_INSTALL_PREFIX", utils.path_join(self.dir_install, self.project))
+
+		cache.set("WITH_VRAY_FOR_BLENDER", True)
+		cache.set("WITH_MANUAL_BUILDINFO", bool(self.teamcity or self.jenkins))
+
+		if self.build_mode == 'nightly':
+			cache.set("LIBS_ROOT", utils.path_join(self.dir_source, 'blender-for-vray-libs'))
+
+		cache.set("WITH_GAMEENGINE", bool(self.with_ge))
+		cache.set("WITH_PLAYER", bool(self.with_player))
+		cache.set("WITH_LIBMV", bool(self.with_tracker))
+		cache.set("WITH_OPENCOLLADA", bool(self.with_collada))
+		cache.set("WITH_CYCLES", bool(self.with_cycles))
+
+		cache.set("WITH_INTERNATIONAL", True)
+		cache.set("WITH_PYTHON_INSTALL", True)
+		cache.set("WITH_PYTHON_INSTALL_NUMPY", True)
+		cache.set("WITH_INPUT_NDOF", True)
+		cache.set("WITH_ALEMBIC", True)
+		cache.set("WITH_FFTW3", True)
+		cache.set("WITH_MOD_OCEANSIM", True)
+		return cache
+
+
+	def configure(self, cmake, cmake_build_dir, cache):
+		"""Run cmake with the cache variables in an initial cache file, unless the build
+		dir was configured with the same fingerprint. Source changes are handled by ninja,
+		it re-runs cmake when a CMakeLists.txt changes. Returns cmake's exit code"""
+		cacheFile = cache.write(os.path.join(cmake_build_dir, CMAKE_INITIAL_CACHE_FILE))
+		cmake = cmake[:1] + ['-C', cacheFile] + cmake[1:]
+
+		fingerprintFile = os.path.join(cmake_build_dir, CONFIGURE_FINGERPRINT_FILE)
+		fingerprint = self.get_configure_fingerprint(cmake + [cache.text()])
+
+		buildDirValid = all(os.path.exists(os.path.join(cmake_build_dir, f)) for f in ('CMakeCache.txt', 'build.ninja'))
+		if buildDirValid and os.path.exists(fingerprintFile):
+			with open(fingerprintFile, 'r') as f:
+				if f.read().strip() == fingerprint:
+					utils.stdout_log('Configuration is unchanged, skipping cmake')
+					return 0
+
+		# Removed first, so a failed configure is never skipped next time
+		if os.path.exists(fingerprintFile):
+			os.remove(fingerprintFile)
+
+		res = subprocess.call(cmake, cwd=cmake_build_dir)
+		if res == 0:
+			utils.write_file_atomic(fingerprintFile, fingerprint + '\n')
+		return res
+
+
+	def install_build(self, cmake_build_dir):
+		"""Run the install rules of the configured build into self.dir_install_path.
+		The prefix is passed to cmake_install.cmake (works with any cmake version)
+		instead of being part of the configure. Returns cmake's exit code"""
+		install = ['cmake', '-D', 'CMAKE_INSTALL_PREFIX=%s' % self.dir_install_path, '-P', 'cmake_install.cmake']
+		utils.stdout_log('Installing to %s' % self.dir_install_path)
+		return subprocess.call(install, cwd=cmake_build_dir)
+
+
+	def report_ninja_build(self, cmake_build_dir, logBefore):
+		"""Report the steps the last ninja run did (the .ninja_log entries that
+		differ from logBefore): slowest compiles and links, critical path and the
+		changes since the previous build. The summary is written to dir_build"""
+		logAfter = utils.read_ninja_log(os.path.join(cmake_build_dir, '.ninja_log'))
+		steps = {o: e for o, e in logAfter.items() if logBefore.get(o) != e}
+		if not steps:
+			utils.stdout_log('Build report: nothing was rebuilt')
+			return
+
+		durations = {o: e[1] - e[0] for o, e in steps.items()}
+
+		# Outputs of one edge share the entry, count it once
+		edges = {(e[0], e[1], e[2]): o for o, e in steps.items()}
+		cpuMs  = sum(e[1] - e[0] for e in edges)
+		wallMs = max(e[1] for e in edges) - min(e[0] for e in edges)
+
+		criticalMs, criticalPath = utils.get_ninja_critical_path(utils.read_ninja_graph(cmake_build_dir), durations)
+
+		def slowest(kind, count):
+			targets = sorted((o for o in edges.values() if utils.get_ninja_target_kind(o) == kind), key=lambda o: -durations[o])
+			return [[o, durations[o] / 1000.0] for o in targets[:count]]
+
+		summary = {
+			'time'            : datetime.datetime.now().isoformat(),
+			'revision'        : self.revision_info['revision'],
+			'branch'          : self.use_github_branch,
+			'build_type'      : self.build_type,
+			'jobs'            : int(self.build_jobs),
+			'steps'           : len(edges),
+			'wall_s'          : wallMs / 1000.0,
+			'cpu_s'           : cpuMs / 1000.0,
+			'critical_path_s' : criticalMs / 1000.0,
+			'critical_path'   : criticalPath,
+			'slowest_compiles': slowest('compile', 15),
+			'slowest_links'   : slowest('link', 5),
+			'targets'         : {o: durations[o] / 1000.0 for o in edges.values()},
+		}
+
+		summaryPath = os.path.join(self.dir_build, NINJA_SUMMARY_FILE)
+		previous = None
+		if os.path.exists(summaryPath):
+			try:
+				with open(summaryPath, 'r') as f:
+					previous = json.load(f)
+			except ValueError:
+				pass
+
+		sys.stdout.write("Build report: %i steps, wall %.1fs, cpu %.1fs, critical path %.1fs\n" % (
+			summary['steps'], summary['wall_s'], summary['cpu_s'], summary['critical_path_s']))
+		sys.stdout.write("  Slowest compiles:\n")
+		for output, seconds in summary['slowest_compiles']:
+			sys.stdout.write("    %7.1fs %s\n" % (seconds, output))
+		sys.stdout.write("  Slowest links:\n")
+		for output, seconds in summary['slowest_links']:
+			sys.stdout.write("    %7.1fs %s\n" % (seconds, output))
+		sys.stdout.write("  Critical path (last steps):\n")
+		for output in criticalPath[-10:]:
+			sys.stdout.write("    %7.1fs %s\n" % (durations[output] / 1000.0, output))
+
+		if previous:
+			sys.stdout.write("  Compared with the previous build (%s):\n" % previous.get('revision', '?'))
+			for key in ('steps', 'wall_s', 'cpu_s', 'critical_path_s'):
+				sys.stdout.write("    %-16s %10.1f -> %.1f\n" % (key, previous.get(key, 0), summary[key]))
+
+			# Same targets that got noticeably slower
+			prevTargets = previous.get('targets', {})
+			regressions = []
+			for output, seconds in summary['targets'].items():
+				before = prevTargets.get(output)
+				if before is not None and seconds - before >= 1.0 and seconds >= before * 1.25:
+					regressions.append((seconds - before, before, seconds, output))
+			regressions.sort(reverse=True)
+			summary['regressions'] = [[output, before, seconds] for delta, before, seconds, output in regressions]
+			for delta, before, seconds, output in regressions[:15]:
+				sys.stdout.write("    slower: %6.1fs -> %6.1fs %s\n" % (before, seconds, output))
+		sys.stdout.flush()
+
+		utils.write_file_atomic(summaryPath, json.dumps(summary, indent=1, sort_keys=True))
+
+		history = dict((k, v) for k, v in summary.items() if k not in {'targets', 'critical_path'})
+		with open(os.path.join(self.dir_build, NINJA_HISTORY_FILE), 'a') as f:
+			f.write(json.dumps(history, sort_keys=True) + '\n')
+
+
+	def setup_compiler_cache(self):
+		"""Export the compiler cache environment for the build,
+		returns the cmake cache variables for the launcher"""
+		self.compiler_cache_path = utils.get_compiler_cache(self.compiler_cache)
+		launcher = self.compiler_cache_path or ''
+
+		if launcher:
+			utils.stdout_log('Using compiler cache %s' % launcher)
+			os.environ.update(utils.get_compiler_cache_env(launcher, self.compiler_cache_dir, self.compiler_cache_size, self.dir_source))
+			utils.compiler_cache_stats(launcher, zero=True)
+
+		# Set even when empty, so disabling the cache resets the cmake cache values
+		return {
+			"CMAKE_C_COMPILER_LAUNCHER"   : launcher,
+			"CMAKE_CXX_COMPILER_LAUNCHER" : launcher,
+		}
+
+
+	def print_compiler_cache_stats(self):
+		if getattr(self, 'compiler_cache_path', None):
+			utils.compiler_cache_stats(self.compiler_cache_path)
+
+
 	def compile_post(self):
 		if self.host_os == utils.WIN:
 			runtimeDir = utils.path_join(self.patch_dir, "non-gpl", self.build_arch)
@@ -421,21 +911,34 @@ class Builder:
 				sys.stderr.write("Something went wrong! Can't add Python modules and exporter!\n")
 				sys.exit(3)
 
-			os.chdir(addonsPath)
+			# Persistent checkout, only new objects are fetched on update
+			checkoutPath = utils.path_join(self.dir_source, "vray_for_blender_exporter")
+			cloneArgs = utils.get_git_clone_args(self.git_depth, self.git_filter)
+			if not os.path.exists(checkoutPath):
+				os.chdir(self.dir_source)
+				os.system("git clone %s%shttps://github.com/ChaosGroup/vray_for_blender_exporter vray_for_blender_exporter"
+						  % (cloneArgs, '--no-single-branch ' if self.git_depth else ''))
+			else:
+				os.chdir(checkoutPath)
+				os.system("git fetch %sorigin" % cloneArgs)
+
+			os.chdir(checkoutPath)
+			os.system("git checkout -f -B {branch} origin/{branch}".format(branch=self.use_exp_branch))
+			os.system("git clean -ffd")
+			utils.update_git_submodules(checkoutPath, jobs=self.git_jobs, args=cloneArgs, log_prefix='exporter')
+			utils.foreach_git_submodule(checkoutPath, "git fetch origin && git checkout -f -B master origin/master",
+										jobs=self.git_jobs, log_prefix='exporter')
+
+			# Only changed files are written, the rest keep their mtimes.
+			# .git is not synced: vb30 is a plain copy of the sources and not a git
+			# checkout anymore, git operations go to the persistent checkout above
 			exporterPath = utils.path_join(addonsPath, "vb30")
-			if os.path.exists(exporterPath):
-				utils.remove_directory(exporterPath)
-			os.system("git clone --recursive https://github.com/ChaosGroup/vray_for_blender_exporter vb30")
-
-			if self.use_exp_branch not in {'master'}:
-				os.chdir(exporterPath)
-				os.system("git remote update")
-				os.system("git checkout -b {branch} origin/{branch}".format(branch=self.use_exp_branch))
-
-			os.chdir(exporterPath)
-			os.system("git submodule update --init --recursive")
-			os.system("git submodule foreach git checkout master")
-			os.system("git submodule foreach git pull --rebase origin master")
+			if os.path.isdir(os.path.join(exporterPath, ".git")):
+				# Left from the clone the exporter used to be, it would not match the files
+				utils.remove_directory(os.path.join(exporterPath, ".git"))
+			copied, removed = utils.sync_tree(checkoutPath, exporterPath)
+			sys.stdout.write("Exporter synced: %d files updated, %d removed\n" % (copied, removed))
+			sys.stdout.flush()
 
 
 	def package(self):
@@ -607,7 +1110,7 @@ class Builder:
 		lines = []
 		lines.append('#define BUILD_COMMIT_TIMESTAMP 0')
 		lines.append('#define BUILD_BRANCH "%s"' % (self.use_github_branch))
-		lines.append('#define BUILD_HASH "%s"' % (self.revision[:7]))
+		lines.append('#define BUILD_HASH "%s"' % (self.revision_info['revision'][:7]))
 		lines.append('#define BUILD_DATE "%s"' % (now.strftime("%d %b %Y")))
 		lines.append('#define BUILD_TIME "%s"' % (now.strftime("%H:%M:%S")))
 		lines.append('')
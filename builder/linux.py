@@ -29,6 +29,21 @@ import glob
 import shutil
 import subprocess
 import inspect
+import hashlib
+import io
+import json
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import collections
+import concurrent.futures
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
 
 from .builder import utils
 from .builder import Builder
@@ -55,8 +70,21 @@ COLLADA_VERSION    = "1.6.51"
 COLLADA_UID        = "0c2cdc17c22cf42050e4d42154bed2176363549c"
 
 LIBS_PREFIX = None
+
+# Generation in prebuilt_cache.txt of the last libs built before the per library keys
 LIBS_GENERATION = 29
 
+# Rough peak memory of a single compile job in MB, used to limit
+# the job count until a measured value is recorded in the history
+DEPS_PEAK_RSS_MB = {
+	'boost'  : 1024,
+	'oiio'   : 1024,
+	'clang'  : 2048,
+	'osl'    : 1536,
+	'ffmpeg' : 512,
+	'collada': 1024,
+}
+
 
 def getLibPath(name, *subdirs):
 	"""Get correct install dir for library uising global var for version
@@ -93,15 +121,21 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 		return True
 
 	def getChDirCmd(newDir):
-		return lambda: os.chdir(newDir) or True
+		# Libraries are built concurrently so we can't change the process cwd,
+		# runDepsSteps() will track the directory for the following steps
+		def chDirFn():
+			return os.path.isdir(newDir)
+		chDirFn.chdir = newDir
+		return chDirFn
 
 	def getDownloadCmd(url, name):
 		def downloadFn():
-			utils.stdout_log('wget -c "%s" -O %s' % (url, name))
-			if os.path.exists(name):
-				utils.stdout_log('file [%s] exists, will remove' % name)
-				utils.remove_file(name)
-			return 0 == os.system('wget -c "%s" -O %s' % (url, name))
+			return utils.download_cached(url, os.path.join(wd, name), self._blender_libs_downloads,
+										 mirror=self.deps_mirror)
+		downloadFn.url = url
+		downloadFn.name = name
+		downloadFn.prefetch = lambda: None != utils.fetch_to_cache(url, name, self._blender_libs_downloads,
+																   mirror=self.deps_mirror)
 		return downloadFn
 
 	def patchOpenEXRCmake():
@@ -125,7 +159,10 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 		return True
 
 	def getOrCmd(a, b):
-		return lambda: a() or b()
+		orFn = lambda: a() or b()
+		orFn.alternatives = (a, b)
+		orFn.prefetch = lambda: a.prefetch() or b.prefetch()
+		return orFn
 
 	def removeSoFile(path):
 		if os.path.isfile(path):
@@ -138,7 +175,7 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 		return lambda: all([removeSoFile(path) for path in glob.glob('%s/*.so*')])
 
 	steps = (
-		('python', '%s/python-%s' % (prefix, PYTHON_VERSION), (
+		('python', '%s/python-%s' % (prefix, PYTHON_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("https://www.python.org/ftp/python/%s/Python-%s.tgz" % (PYTHON_VERSION, PYTHON_VERSION), 'python.tgz'),
 			'tar -C . -xf python.tgz',
@@ -147,22 +184,22 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 				% (prefix, PYTHON_VERSION, prefix, PYTHON_VERSION),
 			'make -j %s' % jobs,
 			'make install',
-			'ln -s %s/python-%s %s/python' % (prefix, PYTHON_VERSION, prefix),
-			'ln -s %s/python-%s %s/python-%s' % (prefix, PYTHON_VERSION, prefix, PYTHON_VERSION_BIG),
+			'ln -sfn %s/python-%s %s/python' % (prefix, PYTHON_VERSION, prefix),
+			'ln -sfn %s/python-%s %s/python-%s' % (prefix, PYTHON_VERSION, prefix, PYTHON_VERSION_BIG),
 		)),
-		('requests', '%s/python/lib/python%s/site-packages/requests/api.py' % (prefix, PYTHON_VERSION_BIG), (
+		('requests', '%s/python/lib/python%s/site-packages/requests/api.py' % (prefix, PYTHON_VERSION_BIG), ('python',), (
 			'%s/python/bin/pip%s install requests' % (prefix, PYTHON_VERSION_BIG),
 		)),
-		('numpy', '%s/python/lib/python%s/site-packages/numpy' % (prefix, PYTHON_VERSION_BIG), (
+		('numpy', '%s/python/lib/python%s/site-packages/numpy' % (prefix, PYTHON_VERSION_BIG), ('python',), (
 			getChDirCmd(wd),
 			getDownloadCmd("https://github.com/numpy/numpy/releases/download/v%s/numpy-%s.tar.gz" % (NUMPY_VERSION, NUMPY_VERSION), 'numpy.tar.gz'),
 			'tar -C . -xf numpy.tar.gz',
 			getChDirCmd(os.path.join(wd, 'numpy-%s' % NUMPY_VERSION)),
 			'%s/python/bin/python3 setup.py install --old-and-unmanageable --prefix=%s/numpy-%s' % (prefix, prefix, NUMPY_VERSION),
-			'ln -sf %s/numpy-%s %s/numpy' % (prefix, NUMPY_VERSION, prefix)
+			'ln -sfn %s/numpy-%s %s/numpy' % (prefix, NUMPY_VERSION, prefix)
 			#'mv %s/numpy-%s %s/numpy' % (prefix, NUMPY_VERSION, prefix) # move numpy because cmake will append numpy to the path given
 		)),
-		('boost', '%s/boost-%s' % (prefix, BOOST_VERSION),(
+		('boost', '%s/boost-%s' % (prefix, BOOST_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("http://sourceforge.net/projects/boost/files/boost/%s/boost_%s.tar.bz2/download" % (BOOST_VERSION, BOOST_VERSION.replace('.', '_')), 'boost.tar.bz2'),
 			'tar -C . --transform "s,(.*/?)boost_1_[^/]+(.*),\\1boost-%s\\2,x" -xf boost.tar.bz2' % BOOST_VERSION,
@@ -171,12 +208,12 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'./b2 -j %s -a --with-system --with-filesystem --with-thread --with-regex --with-locale --with-date_time --with-wave --prefix=%s/boost-%s --disable-icu boost.locale.icu=off install'
 				% (jobs, prefix, BOOST_VERSION),
 			'./b2 clean',
-			'ln -s %s/boost-%s %s/boost' % (prefix, BOOST_VERSION, prefix),
+			'ln -sfn %s/boost-%s %s/boost' % (prefix, BOOST_VERSION, prefix),
 			'sh -c "echo \"%s/boost/lib\" > /etc/ld.so.conf.d/boost.conf"' % prefix,
 			'/sbin/ldconfig',
 			getRemoveSoFiles('%s/boost/lib' % prefix)
 		)),
-		('png', '%s/png-%s' % (prefix, PNG_VERSION), (
+		('png', '%s/png-%s' % (prefix, PNG_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://sourceforge.net/projects/libpng/files/libpng12/%s/libpng-%s.tar.xz/download' % (PNG_VERSION, PNG_VERSION), 'libpng-%s.tar.xz' % PNG_VERSION),
 			'tar -C . -xf libpng-%s.tar.xz' % PNG_VERSION,
@@ -184,9 +221,9 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'./configure --prefix=%s/png-%s --enable-static=yes --enable-shared=no' % (prefix, PNG_VERSION),
 			'make -j %s' % jobs,
 			'make install',
-			'ln -s %s/png-%s %s/png' % (prefix, PNG_VERSION, prefix),
+			'ln -sfn %s/png-%s %s/png' % (prefix, PNG_VERSION, prefix),
 		)),
-		('tiff', '%s/tiff-%s' % (prefix, TIFF_VERSION), (
+		('tiff', '%s/tiff-%s' % (prefix, TIFF_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('http://download.osgeo.org/libtiff/tiff-%s.tar.gz' % TIFF_VERSION, 'tiff.tar.gz'),
 			'tar -C . -xf tiff.tar.gz',
@@ -194,11 +231,11 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'./configure --prefix=%s/tiff-%s --enable-static' % (prefix, TIFF_VERSION),
 			'make -j %s' % jobs,
 			'make  install',
-			'ln -s %s/tiff-%s %s/tiff' % (prefix, TIFF_VERSION, prefix),
+			'ln -sfn %s/tiff-%s %s/tiff' % (prefix, TIFF_VERSION, prefix),
 			'sh -c "echo \"%s/tiff/lib\" > /etc/ld.so.conf.d/tiff.conf"' % prefix,
 			'/sbin/ldconfig'
 		)),
-		('fftw', '%s/fftw-%s' % (prefix, FFTW_VERSION), (
+		('fftw', '%s/fftw-%s' % (prefix, FFTW_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('http://www.fftw.org/fftw-%s.tar.gz' % FFTW_VERSION, 'fftw.tar.gz'),
 			'tar -C . -xf fftw.tar.gz',
@@ -206,11 +243,11 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'./configure --prefix=%s/fftw-%s --enable-static' % (prefix, FFTW_VERSION),
 			'make -j %s' % jobs,
 			'make  install',
-			'ln -s %s/fftw-%s %s/fftw' % (prefix, FFTW_VERSION, prefix),
+			'ln -sfn %s/fftw-%s %s/fftw' % (prefix, FFTW_VERSION, prefix),
 			'sh -c "echo \"%s/fftw/lib\" > /etc/ld.so.conf.d/fftw.conf"' % prefix,
 			'/sbin/ldconfig'
 		)),
-		('ocio', '%s/ocio-%s' % (prefix, OCIO_VERSION), (
+		('ocio', '%s/ocio-%s' % (prefix, OCIO_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("https://github.com/imageworks/OpenColorIO/tarball/v%s" % OCIO_VERSION, 'ocio.tar.gz'),
 			'tar -C . --transform "s,(.*/?)imageworks-OpenColorIO[^/]*(.*),\\1OpenColorIO-%s\\2,x" -xf ocio.tar.gz' % OCIO_VERSION,
@@ -225,11 +262,11 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'cp ext/dist/lib/libtinyxml.a %s/ocio-%s/lib' % (prefix, OCIO_VERSION),
 			'cp ext/dist/lib/libyaml-cpp.a %s/ocio-%s/lib' % (prefix, OCIO_VERSION),
 			'make clean',
-			'ln -s %s/ocio-%s %s/ocio' % (prefix, OCIO_VERSION, prefix),
+			'ln -sfn %s/ocio-%s %s/ocio' % (prefix, OCIO_VERSION, prefix),
 			'sh -c "echo \"%s/ocio/lib\" > /etc/ld.so.conf.d/ocio.conf"' % prefix,
 			'/sbin/ldconfig'
 		)),
-		('ilmbase', '%s/ilmbase-%s' % (prefix, ILMBASE_VERSION), (
+		('ilmbase', '%s/ilmbase-%s' % (prefix, ILMBASE_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("http://download.savannah.nongnu.org/releases/openexr/ilmbase-%s.tar.gz" % ILMBASE_VERSION, 'ilmbase.tar.gz'),
 			'tar -C . --transform "s,(.*/?)ilmbase-[^/]*(.*),\\1ILMBase-%s\\2,x" -xf ilmbase.tar.gz' % ILMBASE_VERSION,
@@ -242,7 +279,7 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make install',
 			'make clean',
 		)),
-		('openexr', '%s/openexr-%s' % (prefix, OPENEXR_VERSION), (
+		('openexr', '%s/openexr-%s' % (prefix, OPENEXR_VERSION), ('ilmbase',), (
 			getChDirCmd(wd),
 			getDownloadCmd("http://download.savannah.nongnu.org/releases/openexr/openexr-%s.tar.gz" % OPENEXR_VERSION, 'openexr.tar.gz'),
 			'tar -C . --transform "s,(.*/?)openexr[^/]*(.*),\\1OpenEXR-%s\\2,x" -xf openexr.tar.gz' % OPENEXR_VERSION,
@@ -257,11 +294,11 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make install',
 			'make clean',
 			'cp -Lrn %s/ilmbase-%s/* %s/openexr-%s' % (prefix, ILMBASE_VERSION, prefix, OPENEXR_VERSION),
-			'ln -s %s/openexr-%s %s/openexr' % (prefix, OPENEXR_VERSION, prefix),
+			'ln -sfn %s/openexr-%s %s/openexr' % (prefix, OPENEXR_VERSION, prefix),
 			'sh -c "echo \"%s/openexr/lib\" > /etc/ld.so.conf.d/openexr.conf"' % prefix,
 			'/sbin/ldconfig'
 		)),
-		('oiio', '%s/oiio-%s' % (prefix, OIIO_VERSION), (
+		('oiio', '%s/oiio-%s' % (prefix, OIIO_VERSION), ('boost', 'png', 'tiff', 'openexr'), (
 			getChDirCmd(wd),
 			getDownloadCmd("https://github.com/OpenImageIO/oiio/archive/Release-%s.tar.gz" % OIIO_VERSION, 'oiio.tar.gz'),
 			'mkdir -p OpenImageIO-%s' % OIIO_VERSION,
@@ -282,11 +319,11 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make -j %s' % jobs,
 			'make install',
 			'make clean',
-			'ln -s %s/oiio-%s %s/oiio' % (prefix, OIIO_VERSION, prefix),
+			'ln -sfn %s/oiio-%s %s/oiio' % (prefix, OIIO_VERSION, prefix),
 			'sh -c "echo \"%s/oiio/lib\" > /etc/ld.so.conf.d/oiio.conf"' % prefix,
 			'/sbin/ldconfig'
 		)),
-		('clang', '%s/llvm-%s' % (prefix, LLVM_VERSION), (
+		('clang', '%s/llvm-%s' % (prefix, LLVM_VERSION), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("http://llvm.org/releases/%s/llvm-%s.src.tar.gz" % (LLVM_VERSION, LLVM_VERSION), 'llvm.tar.gz'),
 			getOrCmd(
@@ -306,7 +343,7 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make install',
 			'make clean',
 		)),
-		('osl', getLibPath('osl'), (
+		('osl', getLibPath('osl'), ('boost', 'openexr', 'oiio', 'clang'), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://github.com/imageworks/OpenShadingLanguage/archive/Release-%s.tar.gz' % OSL_VERSION, 'osl.tar.gz'),
 			'tar -C . --transform "s,(.*/?)OpenShadingLanguage-[^/]*(.*),\\1OpenShadingLanguage-%s\\2,x" -xf osl.tar.gz' % (OSL_VERSION),
@@ -324,9 +361,9 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make -j %s' % jobs,
 			'make install',
 			'make clean',
-			'ln -s %s %s/osl' % (getLibPath('osl'), prefix),
+			'ln -sfn %s %s/osl' % (getLibPath('osl'), prefix),
 		)),
-		('ffmpeg', getLibPath('ffmpeg'), (
+		('ffmpeg', getLibPath('ffmpeg'), (), (
 			getChDirCmd(wd),
 			getDownloadCmd("http://ffmpeg.org/releases/ffmpeg-%s.tar.bz2" % FFMPEG_VERSION, 'ffmpeg.tar.bz2'),
 			'tar -C . -xf ffmpeg.tar.bz2',
@@ -345,9 +382,9 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make -j %s' % jobs,
 			'make install',
 			'make clean',
-			'ln -s %s %s/ffmpeg' % (getLibPath('ffmpeg'), prefix),
+			'ln -sfn %s %s/ffmpeg' % (getLibPath('ffmpeg'), prefix),
 		)),
-		('giflib', getLibPath('giflib'), (
+		('giflib', getLibPath('giflib'), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('http://downloads.sourceforge.net/giflib/giflib-%s.tar.bz2' % GIFLIB_VERSION, 'giflib.tar.bz2'),
 			'tar -C . -xf giflib.tar.bz2',
@@ -357,12 +394,12 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make install',
 			'make clean',
 		)),
-		('webp', getLibPath('webp'),(
+		('webp', getLibPath('webp'), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://storage.googleapis.com/downloads.webmproject.org/releases/webp/libwebp-%s-linux-x86-64.tar.gz' % WEBP_VERSION, 'webp.tar.gz'),
 			'tar -C %s --transform "s,(.*/?)libwebp-[^/]*(.*),\\1%s\\2,x" -xf webp.tar.gz' % (prefix, os.path.basename(getLibPath('webp'))),
 		)),
-		('libxml2', getLibPath('libxml'), (
+		('libxml2', getLibPath('libxml'), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://git.gnome.org/browse/libxml2/snapshot/libxml2-%s.tar.xz' % LIBXML_VERSION, 'libxml.tar.xz'),
 			'tar -C . -xf libxml.tar.xz',
@@ -371,7 +408,7 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make -j %s' % jobs,
 			'make install',
 		)),
-		('pcre', getLibPath('pcre'), (
+		('pcre', getLibPath('pcre'), (), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://ftp.pcre.org/pub/pcre/pcre-%s.tar.gz' % PCRE_VERSION, 'pcre.tar.gz'),
 			'tar -C . -xf pcre.tar.gz',
@@ -382,7 +419,7 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 			'make install',
 			'make clean',
 		)),
-		('collada', getLibPath('collada'), (
+		('collada', getLibPath('collada'), ('pcre', 'libxml2'), (
 			getChDirCmd(wd),
 			getDownloadCmd('https://github.com/KhronosGroup/OpenCOLLADA/archive/%s.zip' % COLLADA_UID, 'collada.zip'),
 			'unzip -o collada.zip',
@@ -401,6 +438,436 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 	return steps
 
 
+def getDepsStateDir(prefix):
+	"""Directory inside the libs prefix that keeps the build state of each library"""
+	return os.path.join(prefix, '.deps')
+
+
+def getStepKey(self, step):
+	"""Text describing a step for hashing. Host specific paths are replaced
+	so the keys stay the same for a different prefix or build dir"""
+	if not callable(step):
+		text = step
+	elif hasattr(step, 'chdir'):
+		text = 'cd %s' % step.chdir
+	elif hasattr(step, 'url'):
+		text = 'download %s %s' % (step.url, step.name)
+	elif hasattr(step, 'alternatives'):
+		text = ' || '.join([getStepKey(self, alt) for alt in step.alternatives])
+	else:
+		text = inspect.getsource(step).strip()
+
+	paths = (
+		(self._blender_libs_wd,       '<WD>'),
+		(self._blender_libs_location, '<PREFIX>'),
+		(self.dir_source,             '<SOURCE>'),
+	)
+	for path, name in sorted(paths, key=lambda p: len(p[0]), reverse=True):
+		if path:
+			text = text.replace(path, name)
+	return text
+
+
+def getDepsKeys(self, data):
+	"""Hash of every library: its steps (version, url, flags) and the
+	hashes of the libraries it depends on"""
+	keys = {}
+	for item in data:
+		h = hashlib.sha1()
+		h.update(item[0].encode('utf-8'))
+		for dep in sorted(item[2]):
+			h.update(keys[dep].encode('utf-8'))
+		for step in item[3]:
+			h.update(b'\0')
+			h.update(getStepKey(self, step).encode('utf-8'))
+		keys[item[0]] = h.hexdigest()
+	return keys
+
+
+def getDepsStampPath(prefix, name):
+	return os.path.join(getDepsStateDir(prefix), '%s.stamp' % name)
+
+
+def readDepsStamp(prefix, name):
+	"""Key of the completed build of library or None"""
+	stamp = getDepsStampPath(prefix, name)
+	if not os.path.exists(stamp):
+		return None
+	with open(stamp, 'r') as f:
+		return f.read().strip()
+
+
+def writeDepsStamp(prefix, name, key):
+	"""Written only after the last step succeeded"""
+	utils.write_file_atomic(getDepsStampPath(prefix, name), key)
+
+
+def removeDepsStamp(prefix, name):
+	stamp = getDepsStampPath(prefix, name)
+	if os.path.exists(stamp):
+		os.remove(stamp)
+
+
+def DepsPrefetch(self, items):
+	"""Download the sources of all items into the download cache
+	in parallel, so compilation never waits on the network"""
+	downloads = [step for item in items for step in item[3] if hasattr(step, 'prefetch')]
+	if not downloads:
+		return True
+
+	utils.stdout_log('Prefetching %d archives, %d at a time...' % (len(downloads), self.deps_download_jobs))
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.deps_download_jobs)) as pool:
+		results = list(pool.map(lambda step: step.prefetch(), downloads))
+
+	for step, ok in zip(downloads, results):
+		if not ok:
+			name = step.alternatives[0].name if hasattr(step, 'alternatives') else step.name
+			utils.stderr_log('Failed to prefetch [%s]' % name)
+
+	return all(results)
+
+
+def getDepsStepHashes(self, key, steps):
+	"""Input hash of every step: library key chained with all steps up to it"""
+	hashes = []
+	prev = key
+	for step in steps:
+		prev = hashlib.sha1(('%s\0%s' % (prev, getStepKey(self, step))).encode('utf-8')).hexdigest()
+		hashes.append(prev)
+	return hashes
+
+
+def getDepsJournalPath(prefix, name):
+	return os.path.join(getDepsStateDir(prefix), '%s.journal' % name)
+
+
+def readDepsJournal(prefix, name, key):
+	"""Returns the step hashes recorded for this library key: {step index: hash},
+	a journal written for a different key is discarded"""
+	journal = getDepsJournalPath(prefix, name)
+	if not os.path.exists(journal):
+		return {}
+
+	with open(journal, 'r') as f:
+		lines = [l.split() for l in f.read().splitlines() if l.strip()]
+
+	if not lines or lines[0] != ['key', key]:
+		removeDepsJournal(prefix, name)
+		return {}
+
+	return dict((int(l[0]), l[1]) for l in lines[1:] if len(l) == 2 and l[0].isdigit())
+
+
+def getDepsResumeStep(self, prefix, name, key, steps):
+	"""Index of the first step that has to run again. chdir steps are not
+	recorded in the journal (they are run on every start), they are skipped"""
+	recorded = readDepsJournal(prefix, name, key)
+	hashes = getDepsStepHashes(self, key, steps)
+	resumeFrom = 0
+	for i, step in enumerate(steps):
+		if callable(step) and hasattr(step, 'chdir'):
+			continue
+		if recorded.get(i) != hashes[i]:
+			return resumeFrom
+		resumeFrom = i + 1
+	return resumeFrom
+
+
+def appendDepsJournal(prefix, name, line):
+	stateDir = getDepsStateDir(prefix)
+	if not os.path.isdir(stateDir):
+		os.makedirs(stateDir)
+	with open(getDepsJournalPath(prefix, name), 'a') as f:
+		f.write('%s\n' % line)
+
+
+def removeDepsJournal(prefix, name):
+	journal = getDepsJournalPath(prefix, name)
+	if os.path.exists(journal):
+		os.remove(journal)
+
+
+_depsHistoryLock = threading.Lock()
+
+
+def getDepsHistoryPath(prefix):
+	return os.path.join(getDepsStateDir(prefix), 'history.json')
+
+
+def readDepsHistory(prefix):
+	"""Measured values of previous builds: {name: {'peak_rss_mb': ...}}"""
+	path = getDepsHistoryPath(prefix)
+	if not os.path.exists(path):
+		return {}
+	try:
+		with open(path, 'r') as f:
+			return json.load(f)
+	except ValueError:
+		return {}
+
+
+def updateDepsHistory(prefix, name, **values):
+	with _depsHistoryLock:
+		history = readDepsHistory(prefix)
+		history.setdefault(name, {}).update(values)
+		utils.write_file_atomic(getDepsHistoryPath(prefix), json.dumps(history, indent=1, sort_keys=True))
+
+
+def getDepsPeakRss(prefix, name):
+	"""Peak memory of one job of library: measured if we have it, declared otherwise"""
+	measured = readDepsHistory(prefix).get(name, {}).get('peak_rss_mb')
+	if measured:
+		return measured
+	return DEPS_PEAK_RSS_MB.get(name)
+
+
+def getDepsParallel(self, jobs):
+	"""Maximum number of libraries that are built at the same time,
+	they share the --build_jobs slots through the jobserver"""
+	parallel = int(self.deps_parallel)
+	if parallel <= 0:
+		parallel = min(4, max(1, jobs // 4))
+	return max(1, min(parallel, jobs))
+
+
+def runDepsSteps(self, item, env, key, jobserver, jobShare=None):
+	"""Run all steps of one getDepsCompilationData item, returns True on success.
+	Finished steps are recorded in the library journal and skipped when
+	a failed build is started again. The caller holds one jobserver token
+	for the library, extra jobs are taken from the jobserver. jobShare() is
+	the most jobs a step that doesn't use the jobserver may hold"""
+	name, wd = item[0], self._blender_libs_wd
+	prefix = self._blender_libs_location
+	log = lambda msg: utils.stdout_log_prefixed(name, msg)
+
+	steps = item[3]
+	hashes = getDepsStepHashes(self, key, steps)
+	resumeFrom = getDepsResumeStep(self, prefix, name, key, steps)
+
+	# Sources from the previous run are gone, nothing to resume from
+	for step in steps[:resumeFrom]:
+		if hasattr(step, 'chdir') and not os.path.isdir(step.chdir):
+			log('Missing [%s], restarting from the first step' % step.chdir)
+			resumeFrom = 0
+			break
+
+	if resumeFrom:
+		log('Resuming at step %d of %d' % (resumeFrom + 1, len(steps)))
+	else:
+		removeDepsJournal(prefix, name)
+		appendDepsJournal(prefix, name, 'key %s' % key)
+
+	started = time.time()
+	peakRss = getDepsPeakRss(prefix, name)
+	# Keep the highest value, resumed builds may run only the light steps
+	measuredRss = readDepsHistory(prefix).get(name, {}).get('peak_rss_mb', 0)
+
+	cwd = wd
+	for i, step in enumerate(steps):
+		if callable(step) and hasattr(step, 'chdir'):
+			log('CWD %s' % step.chdir)
+			if not step():
+				log('Missing directory [%s]' % step.chdir)
+				return False
+			cwd = step.chdir
+			continue
+
+		if i < resumeFrom:
+			continue
+
+		if callable(step):
+			log('Callable step: \n\t%s' % inspect.getsource(step).strip())
+			if not step():
+				return False
+		else:
+			if self.jenkins and (step.endswith('ldconfig') or '/etc/ld.so.conf.d' in step):
+				# lets skip system wide changes for jenkins
+				log('Skipping [%s] step because of jenkins flag!' % step)
+			else:
+				cmd, stepEnv, passFds, taken = step, env, (), 0
+				if '${DEPS_JOBS}' in step:
+					jobs = utils.plan_jobs(jobserver.jobs, peakRss)
+					if jobs < jobserver.jobs:
+						log('Limiting jobs %d -> %d, peak memory per job %d MB' % (jobserver.jobs, jobs, peakRss))
+
+					if jobs == jobserver.jobs and 'make -j ${DEPS_JOBS}' in step:
+						# Explicit -j would make the child ignore the jobserver
+						cmd = step.replace('make -j ${DEPS_JOBS}', 'make')
+						stepEnv = dict(env, MAKEFLAGS=env.get('MAKEFLAGS', '') + jobserver.makeflags())
+						passFds = jobserver.fds
+					else:
+						# b2 / ninja and memory limited steps hold their tokens while running,
+						# only up to their share, so the other libraries can still start
+						if jobShare:
+							jobs = min(jobs, jobShare())
+						taken = jobserver.acquire(jobs - 1, block=False)
+						stepEnv = dict(env, DEPS_JOBS=str(taken + 1))
+
+				log('Command step: \n\t%s' % cmd)
+				try:
+					res = utils.exec_prefixed_ex(cmd, name, cwd=cwd, env=stepEnv, shell=True, pass_fds=passFds)
+				finally:
+					jobserver.release(taken)
+				if res['peak_rss_mb'] and res['peak_rss_mb'] > measuredRss:
+					measuredRss = res['peak_rss_mb']
+					updateDepsHistory(prefix, name, peak_rss_mb=measuredRss)
+				if res['code'] != 0:
+					return False
+
+		appendDepsJournal(prefix, name, '%d %s' % (i, hashes[i]))
+
+	if not resumeFrom:
+		updateDepsHistory(prefix, name, duration=int(time.time() - started))
+
+	return True
+
+
+def isDepsLegacyPrefix(self):
+	"""Prefix filled by the last build before the state was kept: no stamps yet and
+	prebuilt_cache.txt holds LIBS_GENERATION. Older generations were built with
+	other flags under the same install dirs, they are not adopted"""
+	prefix = self._blender_libs_location
+	if not os.path.isdir(prefix) or os.path.isdir(getDepsStateDir(prefix)):
+		return False
+	cacheFile = self.get_libs_cache_file_path()
+	if not os.path.exists(cacheFile):
+		return False
+	with open(cacheFile, 'r') as f:
+		generation = f.read().strip()
+	utils.stdout_log('Prefix without build stamps, generation [%s] <=> %d' % (generation, LIBS_GENERATION))
+	return generation == str(LIBS_GENERATION)
+
+
+def getDepsBuildState(prefix, item, key, legacy=False):
+	"""What DepsBuild will do with the library: ('cached' | 'adopt' | 'resume' | 'stale' | 'missing', reason).
+	In a legacy prefix (see isDepsLegacyPrefix) existing install dirs are adopted
+	like the old existence check did, instead of rebuilding all of them once"""
+	stamp = readDepsStamp(prefix, item[0])
+	if stamp == key and os.path.exists(item[1]):
+		return 'cached', 'already installed [%s]' % stamp[:10]
+	if legacy and stamp is None and os.path.isdir(item[1]):
+		return 'adopt', 'installed before build stamps, adopting'
+	if readDepsJournal(prefix, item[0], key):
+		return 'resume', 'partially built'
+	if os.path.lexists(item[1]):
+		if stamp is None:
+			return 'stale', 'incomplete, no stamp'
+		return 'stale', 'key changed [%s] -> [%s]' % (stamp[:10], key[:10])
+	if stamp == key:
+		return 'missing', 'stamp is valid, but the install dir is missing'
+	return 'missing', 'not built'
+
+
+def getDepsStepDescription(step, jobs):
+	"""Text of a step as it would be run"""
+	if callable(step) and hasattr(step, 'chdir'):
+		return 'cd %s' % step.chdir
+	if callable(step) and hasattr(step, 'alternatives'):
+		return ' || '.join(getDepsStepDescription(alt, jobs) for alt in step.alternatives)
+	if callable(step) and hasattr(step, 'url'):
+		return 'download %s -> %s' % (step.url, step.name)
+	if callable(step):
+		return inspect.getsource(step).strip().split('\n')[0]
+	return step.replace('${DEPS_JOBS}', str(jobs))
+
+
+def getDepsDownloadSize(self, steps):
+	"""Bytes that have to be downloaded for steps and the number of archives with unknown size"""
+	total, unknown = 0, 0
+	for step in steps:
+		download = step.alternatives[0] if hasattr(step, 'alternatives') else step
+		if not hasattr(download, 'url') or utils.get_cached_download(download.url, download.name, self._blender_libs_downloads):
+			continue
+		size = utils.get_download_size(download.url)
+		if size is None:
+			unknown += 1
+		else:
+			total += size
+	return total, unknown
+
+
+def getDepsScheduleDuration(items, durations, parallel):
+	"""Wall time of building items the way DepsBuild schedules them: in order,
+	up to parallel at a time, each one after the dependencies it waits for"""
+	names = set(item[0] for item in items)
+	pending = list(items)
+	running = {}
+	finished = {}
+	now = 0
+	while pending or running:
+		for item in list(pending):
+			if len(running) >= parallel:
+				break
+			if all(dep in finished or dep not in names for dep in item[2]):
+				pending.remove(item)
+				running[item[0]] = now + durations.get(item[0], 0)
+		if not running:
+			break
+		name = min(running, key=running.get)
+		now = running.pop(name)
+		finished[name] = now
+	return now
+
+
+def DepsPrintPlan(self, data, keys):
+	"""Dry run of DepsBuild for --test"""
+	prefix = self._blender_libs_location
+	jobs = int(self.build_jobs)
+	history = readDepsHistory(prefix)
+
+	sys.stdout.write('Dependencies build plan (%s):\n' % prefix)
+
+	legacy = isDepsLegacyPrefix(self)
+	toBuild = []
+	for item in data:
+		name = item[0]
+		state, reason = getDepsBuildState(prefix, item, keys[name], legacy)
+		rebuiltDeps = [dep for dep in item[2] if dep in toBuild]
+		if state == 'stale' and rebuiltDeps:
+			reason = '%s, rebuilt dependencies: %s' % (reason, ', '.join(rebuiltDeps))
+
+		sys.stdout.write('  %-10s %-8s %s\n' % (name, state, reason))
+		if state in {'cached', 'adopt'}:
+			continue
+		toBuild.append(name)
+
+		steps = item[3]
+		resumeFrom = 0
+		if state == 'resume':
+			resumeFrom = getDepsResumeStep(self, prefix, name, keys[name], steps)
+
+		stepJobs = utils.plan_jobs(jobs, getDepsPeakRss(prefix, name))
+		for i, step in enumerate(steps):
+			mark = '%4d' % (i + 1)
+			if i < resumeFrom and not hasattr(step, 'chdir'):
+				mark = 'done'
+			elif self.jenkins and isinstance(step, str) and (step.endswith('ldconfig') or '/etc/ld.so.conf.d' in step):
+				mark = 'skip'
+			sys.stdout.write('      %s  %s\n' % (mark, getDepsStepDescription(step, stepJobs)))
+
+	if not toBuild:
+		sys.stdout.write('Nothing to build\n')
+		sys.stdout.flush()
+		return
+
+	items = [item for item in data if item[0] in toBuild]
+	downloadSize, unknownSize = getDepsDownloadSize(self, [step for item in items for step in item[3]])
+	sys.stdout.write('Download size: %.1f MB\n' % (downloadSize / (1024.0 * 1024.0)))
+	if unknownSize:
+		sys.stdout.write('Unknown size of %d archives\n' % unknownSize)
+
+	known = [name for name in toBuild if history.get(name, {}).get('duration') is not None]
+	unknown = [name for name in toBuild if name not in known]
+	if known:
+		durations = dict((name, history.get(name, {}).get('duration') or 0) for name in toBuild)
+		parallel = getDepsParallel(self, jobs)
+		duration = getDepsScheduleDuration(items, durations, parallel)
+		sys.stdout.write('Estimated duration: %d min (previous build times, %d libraries at a time)\n' % ((duration + 59) // 60, parallel))
+	if unknown:
+		sys.stdout.write('No build history for: %s\n' % ', '.join(unknown))
+	sys.stdout.flush()
+
+
 def DepsBuild(self):
 	prefix = self._blender_libs_location
 	wd = self._blender_libs_wd
@@ -408,91 +875,465 @@ def DepsBuild(self):
 	global LIBS_PREFIX
 	LIBS_PREFIX = prefix
 
-	data = getDepsCompilationData(self, prefix, wd, self.build_jobs)
+	# Job count is resolved by the shell, so each library could get its own share
+	data = getDepsCompilationData(self, prefix, wd, '${DEPS_JOBS}')
+
+	names = [item[0] for item in data]
+	for item in data:
+		for dep in item[2]:
+			if dep not in names[:names.index(item[0])]:
+				utils.stderr_log('Dependency [%s] of [%s] must be listed before it!' % (dep, item[0]))
+				sys.exit(-1)
+
+	keys = getDepsKeys(self, data)
 
 	if self.mode_test:
-		# TODO: print out commands
+		DepsPrintPlan(self, data, keys)
 		return
 
 	sys.stdout.write('Building dependencies...\n')
-	installed_python = False
 
-	def alreadyInstalled(path):
-		if not os.path.exists(path):
-			return False
+	legacy = isDepsLegacyPrefix(self)
+	toBuild = set()
+	for item in data:
+		state, reason = getDepsBuildState(prefix, item, keys[item[0]], legacy)
+		if state == 'cached':
+			sys.stdout.write('%s %s, skipping ...\n' % (item[1], reason))
+			continue
+		if state == 'adopt':
+			sys.stdout.write('%s %s ...\n' % (item[1], reason))
+			writeDepsStamp(prefix, item[0], keys[item[0]])
+			continue
+
+		removeDepsStamp(prefix, item[0])
+		if state == 'resume':
+			sys.stdout.write('%s is %s, resuming\n' % (item[1], reason))
+		elif state == 'stale':
+			sys.stdout.write('%s is stale (%s), removing and rebuilding\n' % (item[1], reason))
+			utils.remove_path(item[1])
+		else:
+			sys.stdout.write('%s missing (%s) - proceeding\n' % (item[1], reason))
+		toBuild.add(item[0])
+	sys.stdout.flush()
 
-		content = utils.dir_contents_recursive(path)
-		if len(content) == 0:
-			return False
+	if not DepsPrefetch(self, [item for item in data if item[0] in toBuild]):
+		utils.stderr_log('Failed to download dependency sources, stopping...')
+		sys.exit(-1)
 
-		return True
+	jobs = int(self.build_jobs)
+	parallel = getDepsParallel(self, jobs)
+	jobserver = utils.JobServer(jobs)
+	env = dict(os.environ, DEPS_JOBS=str(jobs))
+	env.pop('MAKEFLAGS', None)
+	if self.build_load_limit:
+		env['MAKEFLAGS'] = '-l%s' % self.build_load_limit
+
+	# One mechanism per cache, so a compile doesn't go through it twice: ccache is found
+	# as the compiler in PATH by all steps, sccache can only be a CMake launcher
+	launcher = utils.get_compiler_cache(self.compiler_cache)
+	if launcher:
+		utils.stdout_log('Using compiler cache %s' % launcher)
+		binDir = utils.get_compiler_cache_bin_dir(launcher)
+		if binDir:
+			env['PATH'] = os.pathsep.join([binDir, env.get('PATH', '')])
+		cmakeLauncher = not binDir and (utils.get_cmake_version() or (0,)) >= (3, 17)
+		if not binDir and not cmakeLauncher:
+			utils.stderr_log('CMake < 3.17 ignores CMAKE_<LANG>_COMPILER_LAUNCHER, dependencies are built without %s' % launcher)
+		if not cmakeLauncher:
+			# Could be inherited from the environment
+			env.pop('CMAKE_C_COMPILER_LAUNCHER', None)
+			env.pop('CMAKE_CXX_COMPILER_LAUNCHER', None)
+		env.update(utils.get_compiler_cache_env(launcher, self.compiler_cache_dir, self.compiler_cache_size, wd, cmakeLauncher))
+		utils.compiler_cache_stats(launcher, env, zero=True)
+	utils.stdout_log('Building %d libraries, up to %d at a time sharing %d jobs' % (len(toBuild), parallel, jobs))
+
+	pending = [item for item in data if item[0] in toBuild]
+	running = {}
+	finished = queue.Queue()
+	built = set()
+	failed = []
+
+	def jobShare():
+		# Jobs split between the libraries that are or could be built at the same time
+		ready = [item for item in list(pending) if all(dep in built or dep in running or dep not in toBuild for dep in item[2])]
+		return max(1, jobs // max(1, min(parallel, len(ready) + len(running))))
+
+	def worker(item):
+		try:
+			ok = runDepsSteps(self, item, env, keys[item[0]], jobserver, jobShare)
+		except Exception as e:
+			utils.stderr_log('Exception while building %s: %s' % (item[0], e))
+			ok = False
+		finally:
+			jobserver.release()
+		finished.put((item, ok))
+
+	while pending or running:
+		if not failed:
+			for item in list(pending):
+				if len(running) >= parallel:
+					break
+				if all(dep in built or dep not in toBuild for dep in item[2]):
+					# Token for the first job of the library, released by the worker
+					jobserver.acquire()
+					utils.stdout_log('Installing %s...' % item[0])
+					pending.remove(item)
+					running[item[0]] = threading.Thread(target=worker, args=(item,))
+					running[item[0]].start()
+
+		if not running:
+			break
+
+		item, ok = finished.get()
+		if ok:
+			utils.stdout_log('Installed %s [%s]' % (item[0], keys[item[0]][:10]))
+			writeDepsStamp(prefix, item[0], keys[item[0]])
+			removeDepsJournal(prefix, item[0])
+			built.add(item[0])
+		else:
+			failed.append(item)
+		# Popped after built is updated, jobShare() reads both from the workers
+		running.pop(item[0]).join()
+
+	jobserver.close()
+
+	if launcher:
+		utils.compiler_cache_stats(launcher, env)
+
+	if failed:
+		for item in failed:
+			sys.stderr.write('Failed %s! Stopping, the next run will resume from the failed step...\n' % item[0])
+			sys.stderr.flush()
+		sys.exit(-1)
+
+	return True
+
+
+DEPS_BUNDLE_MANIFEST = 'deps-bundle.json'
+DEPS_BUNDLE_FORMAT = 1
 
+
+def getDepsBundleEntries(prefix, data):
+	"""Top level entries of the prefix owned by the libraries: install dirs and their symlinks"""
+	entries = set()
 	for item in data:
-		sys.stdout.write('Installing %s...' % item[0])
-		shouldStop = False
-		if alreadyInstalled(item[1]):
-			if item[0] in ('numpy', 'requests') and installed_python:
-				rm_cmd = 'rm -r %s/%s*' % (prefix, item[0])
-				sys.stdout.write('We reinstalled python, removing %s with [%s] so we can reinstall it also\n' % (item[0], rm_cmd))
-				sys.stdout.flush()
-				os.system(rm_cmd)
-			else:
-				sys.stdout.write('%s already installed, skipping ...\n' % item[1])
+		paths = [item[1]]
+		for step in item[3]:
+			if isinstance(step, str):
+				paths.extend(link for target, link in re.findall(r'ln -sfn (\S+) (\S+)', step))
+		for path in paths:
+			rel = os.path.relpath(path, prefix)
+			if rel == '.' or rel.startswith('..'):
 				continue
+			entries.add(rel.split(os.sep)[0])
+	return sorted(entries)
+
+
+def relocateDepsBundleLink(prefix, rel, target):
+	"""Absolute symlinks pointing inside the prefix are made relative"""
+	if not os.path.isabs(target):
+		return target
+	target = os.path.normpath(target)
+	if target != prefix and not target.startswith(prefix + os.sep):
+		return target
+	return os.path.relpath(target, os.path.dirname(os.path.join(prefix, rel)))
+
+
+def scanDepsBundleFile(path, prefixBytes):
+	"""Returns sha256 of the file, is it a text file and does it contain the prefix"""
+	h = hashlib.sha256()
+	text, found, tail = True, False, b''
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			h.update(chunk)
+			if b'\0' in chunk:
+				text = False
+			if not found and prefixBytes in tail + chunk:
+				found = True
+			tail = chunk[-len(prefixBytes):]
+	return h.hexdigest(), text, found
+
+
+def DepsBundleExport(self, path):
+	"""Pack the built libraries of the prefix into one archive described by a manifest"""
+	prefix = os.path.normpath(self._blender_libs_location)
+	data = getDepsCompilationData(self, prefix, self._blender_libs_wd, '${DEPS_JOBS}')
+	keys = getDepsKeys(self, data)
+
+	missing = [item[0] for item in data if readDepsStamp(prefix, item[0]) != keys[item[0]]]
+	if missing:
+		utils.stderr_log('Can\'t export bundle, libraries are not built: %s' % ', '.join(missing))
+		return False
+
+	if self.mode_test:
+		utils.stdout_log('Would export %d libraries from [%s] to [%s]' % (len(data), prefix, path))
+		return True
+
+	entries = getDepsBundleEntries(prefix, data)
+	manifest = {
+		'format'        : DEPS_BUNDLE_FORMAT,
+		'prefix'        : prefix,
+		'libraries'     : keys,
+		'entries'       : entries,
+		'files'         : {},
+		'symlinks'      : {},
+		'text_files'    : [],
+		'prefix_binaries': [],
+	}
+
+	utils.stdout_log('Scanning %d entries of [%s]...' % (len(entries), prefix))
+	prefixBytes = prefix.encode('utf-8')
+
+	def addLink(rel):
+		manifest['symlinks'][rel] = relocateDepsBundleLink(prefix, rel, os.readlink(os.path.join(prefix, rel)))
+
+	for entry in entries:
+		entryPath = os.path.join(prefix, entry)
+		if os.path.islink(entryPath) or not os.path.isdir(entryPath):
+			files = [entry]
 		else:
-			sys.stdout.write('%s missing - proceeding\n' % item[1])
-			# we will install current item
-			if item[0] == 'python':
-				# if it is python save it
-				installed_python = True
-		sys.stdout.flush()
+			files = []
+			for dirpath, dirnames, filenames in os.walk(entryPath):
+				for name in dirnames + filenames:
+					full = os.path.join(dirpath, name)
+					if os.path.islink(full) or not os.path.isdir(full):
+						files.append(os.path.relpath(full, prefix))
+
+		for rel in files:
+			full = os.path.join(prefix, rel)
+			if os.path.islink(full):
+				addLink(rel)
+			elif os.path.isfile(full):
+				digest, text, found = scanDepsBundleFile(full, prefixBytes)
+				manifest['files'][rel] = digest
+				if found:
+					manifest['text_files' if text else 'prefix_binaries'].append(rel)
+
+	def relocate(info):
+		if info.issym():
+			info.linkname = manifest['symlinks'][info.name]
+		return info
+
+	utils.stdout_log('Writing bundle [%s] with %d files...' % (path, len(manifest['files'])))
+	tmpPath = '%s.part' % path
+	with tarfile.open(tmpPath, 'w:xz' if path.endswith('.xz') else 'w:gz') as tar:
+		manifestData = json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
+		info = tarfile.TarInfo(DEPS_BUNDLE_MANIFEST)
+		info.size = len(manifestData)
+		tar.addfile(info, io.BytesIO(manifestData))
+		for entry in entries:
+			tar.add(os.path.join(prefix, entry), arcname=entry, filter=relocate)
+	os.replace(tmpPath, path)
+
+	utils.stdout_log('Exported %d libraries to [%s]' % (len(keys), path))
+	return True
 
-		fail = False
-		for step in item[2]:
-			sys.stdout.write("CWD %s\n" % os.getcwd())
-			sys.stdout.flush()
-			if callable(step):
-				sys.stdout.write('Callable step: \n\t%s\n' % inspect.getsource(step).strip())
-				sys.stdout.flush()
-				if not step():
-					fail = True
-					break
-				sys.stdout.write('\n')
-			else:
-				if self.jenkins and (step.endswith('ldconfig') or '/etc/ld.so.conf.d' in step):
-					# lets skip system wide changes for jenkins
-					sys.stdout.write('Skipping [%s] step because of jenkins flag!\n' % step)
-				else:
-					sys.stdout.write('Command step: \n\t%s\n' % step)
-					sys.stdout.flush()
-					res = subprocess.call(step, shell=True)
-					sys.stderr.flush()
-					if res != 0:
-						fail = True
-						break
-		if fail:
-			sys.stderr.write('Failed! Removing [%s] if it exists and stopping...\n' % item[1])
-			sys.stderr.flush()
-			if os.path.exists(item[1]):
-				utils.remove_directory(item[1])
-			sys.exit(-1)
 
+def DepsBundleImport(self, path):
+	"""Unpack a bundle made by DepsBundleExport() into the prefix, the contents are
+	verified against the manifest before anything in the prefix is replaced"""
+	prefix = os.path.normpath(self._blender_libs_location)
+
+	if self.mode_test:
+		utils.stdout_log('Would import bundle [%s] into [%s]' % (path, prefix))
+		return True
+
+	if not os.path.isdir(prefix):
+		os.makedirs(prefix)
+
+	staging = tempfile.mkdtemp(prefix='.deps-bundle-', dir=prefix)
+	try:
+		utils.stdout_log('Unpacking bundle [%s]...' % path)
+		with tarfile.open(path, 'r:*') as tar:
+			manifest = json.loads(tar.extractfile(DEPS_BUNDLE_MANIFEST).read().decode('utf-8'))
+			if manifest.get('format') != DEPS_BUNDLE_FORMAT:
+				utils.stderr_log('Unsupported bundle format [%s]!' % manifest.get('format'))
+				return False
+
+			members = []
+			for member in tar.getmembers():
+				if member.name == DEPS_BUNDLE_MANIFEST:
+					continue
+				if os.path.isabs(member.name) or member.name.split('/')[0] not in manifest['entries']:
+					utils.stderr_log('Unexpected bundle member [%s]!' % member.name)
+					return False
+				members.append(member)
+
+			if hasattr(tarfile, 'tar_filter'):
+				tar.extractall(staging, members, filter='tar')
+			else:
+				tar.extractall(staging, members)
+
+		utils.stdout_log('Verifying %d files...' % len(manifest['files']))
+		for rel, digest in manifest['files'].items():
+			full = os.path.join(staging, rel)
+			if not os.path.isfile(full) or utils.file_sha256(full) != digest:
+				utils.stderr_log('Bundle file [%s] is missing or corrupted!' % rel)
+				return False
+		for rel, target in manifest['symlinks'].items():
+			full = os.path.join(staging, rel)
+			if not os.path.islink(full) or os.readlink(full) != target:
+				utils.stderr_log('Bundle symlink [%s] is missing or wrong!' % rel)
+				return False
+
+		if manifest['prefix'] != prefix:
+			utils.stdout_log('Relocating %d text files [%s] -> [%s]' % (len(manifest['text_files']), manifest['prefix'], prefix))
+			oldPrefix = re.compile(re.escape(manifest['prefix'].encode('utf-8')) + b'(?=[/\\s"\';:]|$)', re.MULTILINE)
+			for rel in manifest['text_files']:
+				full = os.path.join(staging, rel)
+				with open(full, 'rb') as f:
+					content = f.read()
+				with open(full, 'wb') as f:
+					f.write(oldPrefix.sub(prefix.encode('utf-8'), content))
+			for rel in manifest['prefix_binaries']:
+				utils.stdout_log('Warning: [%s] has [%s] compiled in' % (rel, manifest['prefix']))
+
+		for entry in manifest['entries']:
+			dest = os.path.join(prefix, entry)
+			if os.path.islink(dest):
+				os.unlink(dest)
+			elif os.path.lexists(dest):
+				utils.remove_path(dest)
+			os.rename(os.path.join(staging, entry), dest)
+
+		for name, key in manifest['libraries'].items():
+			removeDepsJournal(prefix, name)
+			writeDepsStamp(prefix, name, key)
+	finally:
+		utils.remove_directory(staging)
+
+	utils.stdout_log('Imported %d libraries into [%s]' % (len(manifest['libraries']), prefix))
 	return True
 
 
-class LinuxBuilder(Builder):
+BOOST_LIBS = ('date_time', 'filesystem', 'regex', 'system', 'thread', 'locale')
 
-	def post_init(self):
-		self.init_libs_prefix()
-		if self.libs_need_clean():
-			self.clean_prebuilt_libs()
 
-		if DepsBuild(self):
-			self.libs_update_cache_number()
+def getStaticLibsCacheVars(libsPrefix, fullLayout):
+	"""Cache variables pointing Blender to the prebuilt static libraries in libsPrefix.
+	fullLayout is the complete set of libraries built by DepsBuild (CentOS / Jenkins),
+	otherwise only Boost, OpenEXR, OCIO, OIIO and Python are taken from the prefix"""
+	def lib(*path):
+		return os.path.join(libsPrefix, *path)
+
+	python = lib('python-%s' % PYTHON_VERSION_BIG)
+	pythonInclude = os.path.join(python, 'include', 'python%sm' % PYTHON_VERSION_BIG)
+
+	cache = collections.OrderedDict()
+
+	if fullLayout:
+		cache['LIBDIR'] = libsPrefix
+		# NOTES:
+		#   OpenJPEG is disabled in OpenImageIO
+		#   Smth wrong with OpenAL headers - disabling
+		#
+		cache['WITH_OPENAL'] = False
+		cache['FFTW3_INCLUDE_DIR'] = lib('fftw-%s' % FFTW_VERSION, 'include')
+		cache['FFTW3_LIBRARY'] = lib('fftw-%s' % FFTW_VERSION, 'lib', 'libfftw3.a')
+
+	cache['Boost_DIR'] = lib('boost')
+	cache['Boost_INCLUDE_DIR'] = lib('boost', 'include')
+	cache['Boost_LIBRARY_DIRS'] = lib('boost', 'lib')
+	for name in BOOST_LIBS:
+		for suffix in ('', '_DEBUG', '_RELEASE'):
+			cache['Boost_%s_LIBRARY%s' % (name.upper(), suffix)] = lib('boost', 'lib', 'libboost_%s.a' % name)
+
+	if fullLayout:
+		for name in ('Half', 'Iex', 'IlmImf', 'IlmThread', 'Imath'):
+			cache['OPENEXR_%s_LIBRARY' % name.upper()] = lib('openexr', 'lib', 'lib%s.a' % name)
+		cache['OPENEXR_INCLUDE_DIR'] = lib('openexr', 'include')
+	else:
+		cache['OPENEXR_ROOT_DIR'] = lib('openexr')
+		cache['OPENEXR_ILMIMF_LIBRARY'] = lib('openexr', 'lib', 'libIlmImf.a')
+
+	cache['_opencolorio_LIBRARIES'] = lib('ocio', 'lib', 'libOpenColorIO.a')
+	cache['OPENCOLORIO_INCLUDE_DIR'] = lib('ocio', 'include')
+	cache['OPENCOLORIO_TINYXML_LIBRARY'] = lib('ocio', 'lib', 'libtinyxml.a')
+	cache['OPENCOLORIO_YAML-CPP_LIBRARY'] = lib('ocio', 'lib', 'libyaml-cpp.a')
+
+	cache['OPENIMAGEIO_INCLUDE_DIR'] = lib('oiio', 'include')
+	cache['OPENIMAGEIO_LIBRARY'] = lib('oiio', 'lib', 'libOpenImageIO.a')
+
+	cache['PYTHON_VERSION'] = PYTHON_VERSION_BIG
+	cache['PYTHON_ROOT_DIR'] = python
+	cache['PYTHON_LIBRARY'] = os.path.join(python, 'lib', 'libpython%sm.a' % PYTHON_VERSION_BIG)
+	cache['PYTHON_LIBPATH'] = os.path.join(python, 'lib')
+	cache['PYTHON_LIBRARIES'] = os.path.join(python, 'lib')
+	cache['PYTHON_INCLUDE_DIR'] = pythonInclude
+	cache['PYTHON_INCLUDE_CONFIG_DIR'] = pythonInclude
+	cache['PYTHON_NUMPY_PATH'] = libsPrefix # cmake will append numpy to path
+
+	if fullLayout:
+		cache['TIFF_INCLUDE_DIR'] = lib('tiff', 'include')
+		cache['TIFF_LIBRARY'] = lib('tiff', 'lib', 'libtiff.a')
+
+		cache['LLVM_ROOT_DIR'] = lib('llvm-%s' % LLVM_VERSION)
+		cache['FFMPEG_ROOT_DIR'] = lib('ffmpeg')
+
+		cache['OSL_ROOT_DIR'] = lib('osl-%s' % OSL_VERSION)
+		cache['OSL_ROOT'] = lib('osl-%s' % OSL_VERSION)
+		cache['OSL_INCLUDE_DIR'] = lib('osl-%s' % OSL_VERSION, 'include')
+
+		cache['GIFLIB_LIBRARY'] = lib('giflib-%s' % GIFLIB_VERSION, 'lib', 'libgif.a')
+		cache['WEBP_LIBRARY'] = lib('webp-%s' % WEBP_VERSION, 'lib', 'libwebp.a')
+		cache['OPENCOLLADA_ROOT_DIR'] = getLibPath('collada')
 
+		cache['PCRE_ROOT_DIR'] = getLibPath('pcre')
 
-	def get_cache_num(self):
-		return LIBS_GENERATION
+	return cache
+
+
+class LinuxBuilder(Builder):
+
+	def post_init(self):
+		self.init_libs_prefix()
+		if self.deps_bundle_import:
+			if not DepsBundleImport(self, self.deps_bundle_import):
+				sys.exit(-1)
+
+		DepsBuild(self)
+
+		if self.deps_bundle_export:
+			if not DepsBundleExport(self, self.deps_bundle_export):
+				sys.exit(-1)
+			sys.exit(0)
+
+
+	def get_link_cmake_cache(self):
+		"""Linker and debug info flags. The static Blender link is the longest serial
+		step of the build, lld / gold are much faster than bfd and split DWARF keeps
+		the debug info out of the link"""
+		linker = utils.detect_linker(self.gcc or os.environ.get('CC', 'cc'), self.linker)
+		utils.stdout_log('Linking with %s' % linker)
+
+		compileFlags = []
+		linkFlags = ['-fuse-ld=%s' % linker]
+		if linker == 'gold':
+			linkFlags.append('-Wl,--threads')
+		if self.debug_info == 'split':
+			compileFlags.append('-gsplit-dwarf')
+			if linker != 'bfd':
+				linkFlags.append('-Wl,--gdb-index')
+
+		# Always set, so switching back resets the cmake cache values.
+		# These replace the values cmake would take from the environment
+		cache = {}
+		for lang, envVar in (('C', 'CFLAGS'), ('CXX', 'CXXFLAGS')):
+			cache["CMAKE_%s_FLAGS" % lang] = ' '.join(os.environ.get(envVar, '').split() + compileFlags)
+		for target in ('EXE', 'SHARED', 'MODULE'):
+			cache["CMAKE_%s_LINKER_FLAGS" % target] = ' '.join(os.environ.get('LDFLAGS', '').split() + linkFlags)
+		return cache
+
+
+	def separate_debug_info(self):
+		"""Move the debug info of the installed executables to dir_build/debug-symbols"""
+		debugDir = os.path.join(self.dir_build, "debug-symbols")
+		for name in ("blender", "blenderplayer"):
+			binary = os.path.join(self.dir_install_path, name)
+			if os.path.isfile(binary):
+				debugFile = utils.separate_debug_info(binary, debugDir)
+				if debugFile:
+					utils.stdout_log('Debug info of %s is in %s' % (name, debugFile))
 
 
 	def compile(self):
@@ -515,47 +1356,31 @@ class LinuxBuilder(Builder):
 		if self.gxx:
 			cmake.append("-DCMAKE_CXX_COMPILER=%s" % self.gxx)
 
-		cmake.append("-DCMAKE_BUILD_TYPE=%s" % self.build_type.capitalize())
-		cmake.append('-DCMAKE_INSTALL_PREFIX=%s' % self.dir_install_path)
-
-		cmake.append("-DWITH_SYSTEM_GLEW=OFF")
-		cmake.append("-DWITH_FFTW3=ON")
-		cmake.append("-DWITH_ALEMBIC=ON")
-		cmake.append("-DWITH_CXX11=ON")
-		cmake.append("-DWITH_INPUT_NDOF=ON")
-		cmake.append("-DWITH_X11_XINPUT=ON")
-		cmake.append("-DWITH_INTERNATIONAL=ON")
-		cmake.append("-DWITH_PYTHON_INSTALL=ON")
-		cmake.append("-DWITH_PYTHON_INSTALL_NUMPY=ON")
-
-		cmake.append("-DWITH_VRAY_FOR_BLENDER=ON")
-		cmake.append("-DWITH_MANUAL_BUILDINFO=%s" % utils.GetCmakeOnOff(self.teamcity or self.jenkins))
-		cmake.append('-DWITH_STATIC_LIBC=%s' % utils.GetCmakeOnOff(self.teamcity_with_static_libc))
-
-		if self.build_mode == 'nightly':
-			cmake.append("-DLIBS_ROOT=%s" % utils.path_join(self.dir_source, 'blender-for-vray-libs'))
-
-		cmake.append("-DWITH_GAMEENGINE=%s" % utils.GetCmakeOnOff(self.with_ge))
-		cmake.append("-DWITH_PLAYER=%s" % utils.GetCmakeOnOff(self.with_player))
-		cmake.append("-DWITH_LIBMV=%s" % utils.GetCmakeOnOff(self.with_tracker))
-		cmake.append("-DWITH_OPENCOLLADA=%s" % utils.GetCmakeOnOff(self.with_collada))
-		cmake.append("-DWITH_CYCLES=%s" % utils.GetCmakeOnOff(self.with_cycles))
+		cmake.append(self.dir_blender)
+
+		cache = self.get_cmake_cache()
+		if not self.mode_test:
+			cache.update(self.setup_compiler_cache())
+			cache.update(self.get_link_cmake_cache())
+
+		cache.set("WITH_SYSTEM_GLEW", False)
+		cache.set("WITH_CXX11", True)
+		cache.set("WITH_X11_XINPUT", True)
+		cache.set("WITH_STATIC_LIBC", bool(self.teamcity_with_static_libc))
+
 		if self.with_cycles:
-			cmake.append("-DWITH_CODEC_FFMPEG=ON")
-			cmake.append("-DFFMPEG_LIBRARIES='avformat;avcodec;avutil;avdevice;swscale;swresample;rt'")
-			cmake.append("-DWITH_OPENCOLORIO=ON")
-			cmake.append("-DWITH_OPENIMAGEIO=ON")
-			cmake.append("-DWITH_LLVM=ON")
-			cmake.append("-DLLVM_STATIC=ON")
-			# cmake.append("-DWITH_CYCLES_CUDA=ON")
-			# cmake.append("-DWITH_CYCLES_CUDA_BINARIES=ON")
-			cmake.append("-DWITH_CYCLES_OSL=ON")
-
-		cmake.append("-DWITH_MOD_OCEANSIM=ON")
-		cmake.append("-DWITH_OPENSUBDIV=ON")
-		cmake.append("-DWITH_STATIC_LIBS=ON")
-
-		libs_prefix = '/opt/lib' if utils.get_linux_distribution()['short_name'] == 'centos' else '/opt'
+			cache.set("WITH_CODEC_FFMPEG", True)
+			cache.set("FFMPEG_LIBRARIES", "avformat;avcodec;avutil;avdevice;swscale;swresample;rt")
+			cache.set("WITH_OPENCOLORIO", True)
+			cache.set("WITH_OPENIMAGEIO", True)
+			cache.set("WITH_LLVM", True)
+			cache.set("LLVM_STATIC", True)
+			cache.set("WITH_CYCLES_OSL", True)
+
+		cache.set("WITH_OPENSUBDIV", True)
+		cache.set("WITH_STATIC_LIBS", True)
+
+		libs_prefix = '/opt/lib' if distr_info['short_name'] == 'centos' else '/opt'
 
 		if hasattr(self, '_blender_libs_location'):
 			libs_prefix = self._blender_libs_location
@@ -569,127 +1394,18 @@ class LinuxBuilder(Builder):
 				os.remove(f)
 
 		if self.dev_static_libs:
-			if distr_info['short_name'] == 'centos' or self.jenkins:
-
-				cmake.append("-DLIBDIR=%s" % libs_prefix)
-
-				# NOTES:
-				#   OpenJPEG is disabled in OpenImageIO
-				#   Smth wrong with OpenAL headers - disabling
-				#
-				cmake.append("-DWITH_OPENAL=OFF")
-
-				cmake.append("-DFFTW3_INCLUDE_DIR=%s/fftw-3.3.4/include" % libs_prefix)
-				cmake.append("-DFFTW3_LIBRARY=%s/fftw-3.3.4/lib/libfftw3.a" % libs_prefix)
-
-				cmake.append("-DBoost_DIR=%s/boost" % libs_prefix)
-				cmake.append("-DBoost_INCLUDE_DIR=%s/boost/include" % libs_prefix)
-				cmake.append("-DBoost_LIBRARY_DIRS=%s/boost/lib" % libs_prefix)
-				cmake.append("-DBoost_DATE_TIME_LIBRARY=%s/boost/lib/libboost_date_time.a" % libs_prefix)
-				cmake.append("-DBoost_DATE_TIME_LIBRARY_RELEASE=%s/boost/lib/libboost_date_time.a" % libs_prefix)
-				cmake.append("-DBoost_FILESYSTEM_LIBRARY=%s/boost/lib/libboost_filesystem.a" % libs_prefix)
-				cmake.append("-DBoost_FILESYSTEM_LIBRARY_RELEASE=%s/boost/lib/libboost_filesystem.a" % libs_prefix)
-				cmake.append("-DBoost_REGEX_LIBRARY=%s/boost/lib/libboost_regex.a" % libs_prefix)
-				cmake.append("-DBoost_REGEX_LIBRARY_RELEASE=%s/boost/lib/libboost_regex.a" % libs_prefix)
-				cmake.append("-DBoost_SYSTEM_LIBRARY=%s/boost/lib/libboost_system.a" % libs_prefix)
-				cmake.append("-DBoost_SYSTEM_LIBRARY_RELEASE=%s/boost/lib/libboost_system.a" % libs_prefix)
-				cmake.append("-DBoost_THREAD_LIBRARY=%s/boost/lib/libboost_thread.a" % libs_prefix)
-				cmake.append("-DBoost_THREAD_LIBRARY_RELEASE=%s/boost/lib/libboost_thread.a" % libs_prefix)
-				cmake.append("-DBoost_LOCALE_LIBRARY=%s/boost/lib/libboost_locale.a" % libs_prefix)
-				cmake.append("-DBoost_LOCALE_LIBRARY_RELEASE=%s/boost/lib/libboost_locale.a" % libs_prefix)
-
-				cmake.append("-DOPENEXR_HALF_LIBRARY=%s/openexr/lib/libHalf.a" % libs_prefix)
-				cmake.append("-DOPENEXR_IEX_LIBRARY=%s/openexr/lib/libIex.a" % libs_prefix)
-				cmake.append("-DOPENEXR_ILMIMF_LIBRARY=%s/openexr/lib/libIlmImf.a" % libs_prefix)
-				cmake.append("-DOPENEXR_ILMTHREAD_LIBRARY=%s/openexr/lib/libIlmThread.a" % libs_prefix)
-				cmake.append("-DOPENEXR_IMATH_LIBRARY=%s/openexr/lib/libImath.a" % libs_prefix)
-				cmake.append("-DOPENEXR_INCLUDE_DIR=%s/openexr/include" % libs_prefix)
-
-				cmake.append("-DOPENCOLORIO_INCLUDE_DIR=%s/ocio/include" % libs_prefix)
-				cmake.append("-DOPENCOLORIO_TINYXML_LIBRARY=%s/ocio/lib/libtinyxml.a" % libs_prefix)
-				cmake.append("-DOPENCOLORIO_YAML-CPP_LIBRARY=%s/ocio/lib/libyaml-cpp.a" % libs_prefix)
-				cmake.append("-D_opencolorio_LIBRARIES=%s/ocio/lib/libOpenColorIO.a" % libs_prefix)
-
-				cmake.append("-DOPENIMAGEIO_INCLUDE_DIR=%s/oiio/include/" % libs_prefix)
-				cmake.append("-DOPENIMAGEIO_LIBRARY=%s/oiio/lib/libOpenImageIO.a" % libs_prefix)
-
-				cmake.append("-DPYTHON_VERSION=%s" % PYTHON_VERSION_BIG)
-				cmake.append("-DPYTHON_ROOT_DIR=%s/python-%s" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBRARY=%s/python-%s/lib/libpython%sm.a" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBPATH=%s/python-%s/lib" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBRARIES=%s/python-%s/lib" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_INCLUDE_DIR=%s/python-%s/include/python%sm" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_INCLUDE_CONFIG_DIR=%s/python-%s/include/python%sm" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_NUMPY_PATH=%s" % libs_prefix) # cmake will append numpy to path 
-
-				cmake.append("-DTIFF_INCLUDE_DIR=%s/tiff/include" % libs_prefix)
-				cmake.append("-DTIFF_LIBRARY=%s/tiff/lib/libtiff.a" % libs_prefix)
-
-				cmake.append("-DLLVM_ROOT_DIR=%s/llvm-%s" % (libs_prefix, LLVM_VERSION))
-				cmake.append("-DFFMPEG_ROOT_DIR=%s/ffmpeg" % libs_prefix)
-
-				cmake.append("-DOSL_ROOT_DIR=%s/osl-%s" % (libs_prefix, OSL_VERSION))
-				cmake.append("-DOSL_ROOT=%s/osl-%s" % (libs_prefix, OSL_VERSION))
-				cmake.append("-DOSL_INCLUDE_DIR=%s/osl-%s/include" % (libs_prefix, OSL_VERSION))
-
-				cmake.append("-DGIFLIB_LIBRARY=%s/giflib-%s/lib/libgif.a" % (libs_prefix, GIFLIB_VERSION))
-				cmake.append("-DWEBP_LIBRARY=%s/webp-%s/lib/libwebp.a" % (libs_prefix, WEBP_VERSION))
-				cmake.append("-DOPENCOLLADA_ROOT_DIR=%s" % getLibPath('collada'))
-
-				cmake.append("-DPCRE_ROOT_DIR=%s" % getLibPath('pcre'))
-			else:
-				cmake.append("-DBoost_DIR=%s/boost" % libs_prefix)
-				cmake.append("-DBoost_INCLUDE_DIR=%s/boost/include" % libs_prefix)
-				cmake.append("-DBoost_LIBRARY_DIRS=%s/boost/lib" % libs_prefix)
-				cmake.append("-DBoost_DATE_TIME_LIBRARY=%s/boost/lib/libboost_date_time.a" % libs_prefix)
-				cmake.append("-DBoost_DATE_TIME_LIBRARY_DEBUG=%s/boost/lib/libboost_date_time.a" % libs_prefix)
-				cmake.append("-DBoost_DATE_TIME_LIBRARY_RELEASE=%s/boost/lib/libboost_date_time.a" % libs_prefix)
-				cmake.append("-DBoost_FILESYSTEM_LIBRARY=%s/boost/lib/libboost_filesystem.a" % libs_prefix)
-				cmake.append("-DBoost_FILESYSTEM_LIBRARY_DEBUG=%s/boost/lib/libboost_filesystem.a" % libs_prefix)
-				cmake.append("-DBoost_FILESYSTEM_LIBRARY_RELEASE=%s/boost/lib/libboost_filesystem.a" % libs_prefix)
-				cmake.append("-DBoost_REGEX_LIBRARY=%s/boost/lib/libboost_regex.a" % libs_prefix)
-				cmake.append("-DBoost_REGEX_LIBRARY_DEBUG=%s/boost/lib/libboost_regex.a" % libs_prefix)
-				cmake.append("-DBoost_REGEX_LIBRARY_RELEASE=%s/boost/lib/libboost_regex.a" % libs_prefix)
-				cmake.append("-DBoost_SYSTEM_LIBRARY=%s/boost/lib/libboost_system.a" % libs_prefix)
-				cmake.append("-DBoost_SYSTEM_LIBRARY_DEBUG=%s/boost/lib/libboost_system.a" % libs_prefix)
-				cmake.append("-DBoost_SYSTEM_LIBRARY_RELEASE=%s/boost/lib/libboost_system.a" % libs_prefix)
-				cmake.append("-DBoost_THREAD_LIBRARY=%s/boost/lib/libboost_thread.a" % libs_prefix)
-				cmake.append("-DBoost_THREAD_LIBRARY_DEBUG=%s/boost/lib/libboost_thread.a" % libs_prefix)
-				cmake.append("-DBoost_THREAD_LIBRARY_RELEASE=%s/boost/lib/libboost_thread.a" % libs_prefix)
-				cmake.append("-DBoost_LOCALE_LIBRARY=%s/boost/lib/libboost_locale.a" % libs_prefix)
-				cmake.append("-DBoost_LOCALE_LIBRARY_DEBUG=%s/boost/lib/libboost_locale.a" % libs_prefix)
-				cmake.append("-DBoost_LOCALE_LIBRARY_RELEASE=%s/boost/lib/libboost_locale.a" % libs_prefix)
-				cmake.append("-DOPENEXR_ROOT_DIR=%s/openexr" % libs_prefix)
-				cmake.append("-DOPENEXR_ILMIMF_LIBRARY=%s/openexr/lib/libIlmImf.a" % libs_prefix)
-
-				cmake.append("-D_opencolorio_LIBRARIES=%s/ocio/lib/libOpenColorIO.a" % libs_prefix)
-				cmake.append("-DOPENCOLORIO_INCLUDE_DIR=%s/ocio/include" % libs_prefix)
-				cmake.append("-DOPENCOLORIO_TINYXML_LIBRARY=%s/ocio/lib/libtinyxml.a" % libs_prefix)
-				cmake.append("-DOPENCOLORIO_YAML-CPP_LIBRARY=%s/ocio/lib/libyaml-cpp.a" % libs_prefix)
-
-				cmake.append("-DOPENIMAGEIO_INCLUDE_DIR=%s/oiio/include/" % libs_prefix)
-				cmake.append("-DOPENIMAGEIO_LIBRARY=%s/oiio/lib/libOpenImageIO.a" % libs_prefix)
-
-				cmake.append("-DPYTHON_VERSION=%s" % PYTHON_VERSION_BIG)
-				cmake.append("-DPYTHON_ROOT_DIR=%s/python-%s" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBRARY=%s/python-%s/lib/libpython%sm.a" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBPATH=%s/python-%s/lib" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_LIBRARIES=%s/python-%s/lib" % (libs_prefix, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_INCLUDE_DIR=%s/python-%s/include/python%sm" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_INCLUDE_CONFIG_DIR=%s/python-%s/include/python%sm" % (libs_prefix, PYTHON_VERSION_BIG, PYTHON_VERSION_BIG))
-				cmake.append("-DPYTHON_NUMPY_PATH=%s" %  libs_prefix) # cmake will append numpy to path 
+			cache.update(getStaticLibsCacheVars(libs_prefix, distr_info['short_name'] == 'centos' or self.jenkins))
 
 		if self.jenkins:
-			cmake.append("-DJPEG_LIBRARY=%s" % os.path.join(self.dir_source, 'blender-for-vray-libs', 'Linux', 'jpeg-turbo', 'lib', 'Release', 'libjpeg-turbo.a'))
-			cmake.append("-DJPEG_INCLUDE_DIR=%s" % os.path.join(self.dir_source, 'blender-for-vray-libs', 'Linux', 'jpeg-turbo', 'include'))
-
-		cmake.append(self.dir_blender)
+			cache.set("JPEG_LIBRARY", os.path.join(self.dir_source, 'blender-for-vray-libs', 'Linux', 'jpeg-turbo', 'lib', 'Release', 'libjpeg-turbo.a'))
+			cache.set("JPEG_INCLUDE_DIR", os.path.join(self.dir_source, 'blender-for-vray-libs', 'Linux', 'jpeg-turbo', 'include'))
 
 		sys.stdout.write('cmake args:\n%s\n' % '\n\t'.join(cmake))
+		sys.stdout.write('cmake cache:\n%s\n' % cache.text())
 		sys.stdout.flush()
 
 		if not self.mode_test:
-			res = subprocess.call(cmake)
+			res = self.configure(cmake, cmake_build_dir, cache)
 			if not res == 0:
 				sys.stderr.write("There was an error during configuration!\n")
 				sys.exit(1)
@@ -697,14 +1413,21 @@ class LinuxBuilder(Builder):
 			self.write_buildinfo(cmake_build_dir)
 
 			make = ['ninja']
-			make.append('-j%s' % self.build_jobs)
-			make.append('install')
+			make.extend(self.get_ninja_jobs_args())
 
+			ninjaLog = utils.read_ninja_log(os.path.join(cmake_build_dir, '.ninja_log'))
 			res = subprocess.call(make)
+			self.report_ninja_build(cmake_build_dir, ninjaLog)
+			if res == 0:
+				res = self.install_build(cmake_build_dir)
+			self.print_compiler_cache_stats()
 			if not res == 0:
 				sys.stderr.write("There was an error during the compilation!\n")
 				sys.exit(1)
 
+			if self.debug_info == 'separate' and self.build_type == 'debug':
+				self.separate_debug_info()
+
 
 	def package(self):
 		subdir = "linux" + "/" + self.build_arch
@@ -53,7 +53,8 @@ def getDepsCompilationData(self, prefix, wd, jobs):
 		return lambda: os.chdir(newDir) or True
 
 	def getDownloadCmd(url, name):
-		return lambda: dbg('wget -c %s -O %s/%s' % (url, wd, name)) and 0 == os.system('wget -c "%s" -O %s/%s' % (url, wd, name))
+		return lambda: utils.download_cached(url, os.path.join(wd, name), self._blender_libs_downloads,
+											 mirror=self.deps_mirror)
 
 	def removeSoFile(path):
 		if os.path.isfile(path):
@@ -256,46 +257,31 @@ class MacBuilder(Builder):
 
 		cmake.append("-G")
 		cmake.append("Ninja")
+		cmake.append(self.dir_blender)
+
+		cache = self.get_cmake_cache()
+		cache.update(self.setup_compiler_cache())
 
-		cmake.append("-DCMAKE_BUILD_TYPE=%s" % self.build_type.capitalize())
-		cmake.append('-DCMAKE_INSTALL_PREFIX=%s' % self.dir_install_path)
-		cmake.append("-DWITH_VRAY_FOR_BLENDER=ON")
-		cmake.append("-DWITH_MANUAL_BUILDINFO=%s" % utils.GetCmakeOnOff(self.teamcity or self.jenkins))
-		cmake.append("-DPNG_LIBRARIES=png12")
-		cmake.append("-DWITH_ALEMBIC=ON")
-		cmake.append("-DWITH_INPUT_NDOF=ON")
-		cmake.append("-DWITH_INTERNATIONAL=ON")
-		cmake.append("-DWITH_PYTHON_INSTALL=ON")
-		cmake.append("-DWITH_PYTHON_INSTALL_NUMPY=ON")
-
-		cmake.append("-DWITH_GAMEENGINE=%s" % utils.GetCmakeOnOff(self.with_ge))
-		cmake.append("-DWITH_PLAYER=%s" % utils.GetCmakeOnOff(self.with_player))
-		cmake.append("-DWITH_LIBMV=%s" % utils.GetCmakeOnOff(self.with_tracker))
-		cmake.append("-DWITH_OPENCOLLADA=%s" % utils.GetCmakeOnOff(self.with_collada))
-		cmake.append("-DWITH_CYCLES=%s" % utils.GetCmakeOnOff(self.with_cycles))
-		cmake.append("-DWITH_MOD_OCEANSIM=ON")
-		cmake.append("-DWITH_OPENSUBDIV=OFF")
-		cmake.append("-DWITH_FFTW3=ON")
-		cmake.append("-DWITH_CODEC_FFMPEG=OFF")
+		cache.set("PNG_LIBRARIES", "png12")
+		cache.set("WITH_OPENSUBDIV", False)
+		cache.set("WITH_CODEC_FFMPEG", False)
 
 		prefix = self._blender_libs_location
 		numpyInstallPath = os.path.join(prefix, "numpy", "lib", "python%s" % PYTHON_VERSION_BIG, "site-packages")
-		cmake.append("-DPYTHON_NUMPY_PATH=%s" % numpyInstallPath) # cmake will append numpy to path
+		cache.set("PYTHON_NUMPY_PATH", numpyInstallPath) # cmake will append numpy to path
 
 		if self.with_cycles:
-			cmake.append("-DWITH_LLVM=ON")
-			cmake.append("-DWITH_CYCLES_OSL=ON")
+			cache.set("WITH_LLVM", True)
+			cache.set("WITH_CYCLES_OSL", True)
 
-		if self.build_mode == 'nightly':
-			cmake.append("-DLIBS_ROOT=%s" % utils.path_join(self.dir_source, 'blender-for-vray-libs'))
-		cmake.append("-DWITH_CXX11=ON")
-		cmake.append(self.dir_blender)
+		cache.set("WITH_CXX11", True)
 
 		utils.stdout_log('cmake args:\n%s\n' % '\n\t'.join(cmake))
+		utils.stdout_log('cmake cache:\n%s\n' % cache.text())
 		sys.stdout.flush()
 
 		os.chdir(cmake_build_dir)
-		res = subprocess.call(cmake)
+		res = self.configure(cmake, cmake_build_dir, cache)
 		if not res == 0:
 			sys.stderr.write("There was an error during configuration!\n")
 			sys.exit(1)
@@ -303,10 +289,14 @@ class MacBuilder(Builder):
 		self.write_buildinfo(cmake_build_dir)
 
 		make = ['ninja']
-		make.append('-j%s' % self.build_jobs)
-		make.append('install')
+		make.extend(self.get_ninja_jobs_args())
 
+		ninjaLog = utils.read_ninja_log(os.path.join(cmake_build_dir, '.ninja_log'))
 		res = subprocess.call(make)
+		self.report_ninja_build(cmake_build_dir, ninjaLog)
+		if res == 0:
+			res = self.install_build(cmake_build_dir)
+		self.print_compiler_cache_stats()
 		if not res == 0:
 			sys.stderr.write("There was an error during the compilation!\n")
 			sys.exit(1)
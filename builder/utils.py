@@ -23,16 +23,22 @@
 #
 
 
+import concurrent.futures
+import contextlib
+import filecmp
 import getpass
+import hashlib
 import os
 import platform
 import re
+import select
 import socket
 import stat
 import sys
 import subprocess
 import shutil
 import tempfile
+import threading
 import time
 
 VERSION  = "2.61"
@@ -67,6 +73,18 @@ def stderr_log(*args):
 	sys.stderr.flush()
 
 
+_log_lock = threading.Lock()
+
+
+def stdout_log_prefixed(prefix, text):
+	"""Write every line of text prefixed with [prefix], used when
+	several jobs are writing to stdout at the same time"""
+	lines = ['[%s] %s\n' % (prefix, line) for line in text.rstrip('\n').split('\n')]
+	with _log_lock:
+		sys.stdout.write(''.join(lines))
+		sys.stdout.flush()
+
+
 def get_host_os():
 	if sys.platform == "win32":
 		return WIN
@@ -99,56 +117,420 @@ def exec_and_log(cmd, tag="", exit=False):
 			sys.exit(2)
 
 
-def get_repo(repo_url, branch='master', target_dir=None, target_name=None, submodules=[]):
-	"""
-	This will clone the repo in CWD. If target_dir != None it will copy 
-	the sources to target_dir"""
+def _wait_ex(proc):
+	"""Wait for proc, returns exit code and peak RSS (MB) of the largest process in its tree"""
+	if not hasattr(os, 'wait4'):
+		return proc.wait(), None
 
-	sys.stdout.write("Repo [%s]\n" % repo_url)
-	sys.stdout.flush()
+	pid, status, usage = os.wait4(proc.pid, 0)
+	if os.WIFSIGNALED(status):
+		code = -os.WTERMSIG(status)
+	else:
+		code = os.WEXITSTATUS(status)
+	proc.returncode = code
+
+	# ru_maxrss is in kilobytes on Linux and in bytes on OS X
+	peak = usage.ru_maxrss // 1024
+	if get_host_os() == MAC:
+		peak = peak // 1024
+	return code, peak
+
+
+def call_ex(cmd, cwd=None, env=None, shell=False):
+	"""Like subprocess.call(), but returns {'code': exit code, 'peak_rss_mb': peak RSS or None}"""
+	proc = subprocess.Popen(cmd, cwd=cwd, env=env, shell=shell)
+	code, peak = _wait_ex(proc)
+	return {'code': code, 'peak_rss_mb': peak}
+
+
+def exec_prefixed_ex(cmd, prefix, cwd=None, env=None, shell=False, pass_fds=()):
+	"""Execute cmd and forward its output line by line prefixed with [prefix].
+	Returns {'code': exit code, 'peak_rss_mb': peak RSS or None}"""
+	proc = subprocess.Popen(cmd, cwd=cwd, env=env, shell=shell, pass_fds=pass_fds,
+							stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	for line in iter(proc.stdout.readline, b''):
+		stdout_log_prefixed(prefix, line.decode('utf-8', 'replace'))
+	proc.stdout.close()
+	code, peak = _wait_ex(proc)
+	return {'code': code, 'peak_rss_mb': peak}
+
+
+def exec_prefixed(cmd, prefix, cwd=None, env=None, shell=False):
+	return exec_prefixed_ex(cmd, prefix, cwd, env, shell)['code']
+
+
+class JobServer:
+	"""GNU make jobserver: a pipe holding one token per job slot.
+	Child makes find it through MAKEFLAGS, other tools take tokens
+	with acquire() for the time they are running"""
+
+	def __init__(self, jobs):
+		self.jobs = max(1, int(jobs))
+		self.fds  = os.pipe()
+		os.write(self.fds[1], b'+' * self.jobs)
+
+	def makeflags(self):
+		# --jobserver-fds is understood by make 3.8x and is an alias of --jobserver-auth in 4.x
+		return ' -j --jobserver-fds=%d,%d' % self.fds
+
+	def acquire(self, count=1, block=True):
+		"""Take up to count tokens, returns the number taken.
+		Only the first token is waited for when block is set"""
+		taken = 0
+		while taken < count:
+			if taken or not block:
+				ready = select.select([self.fds[0]], [], [], 0)[0]
+				if not ready:
+					break
+			# A child make could take the token between select() and read(),
+			# then we wait for the next one it gives back
+			os.read(self.fds[0], 1)
+			taken += 1
+		return taken
+
+	def release(self, count=1):
+		if count:
+			os.write(self.fds[1], b'+' * count)
+
+	def close(self):
+		for fd in self.fds:
+			os.close(fd)
+
+
+def get_available_memory_mb():
+	"""Memory available for new processes or None if we can't tell"""
+	if os.path.exists('/proc/meminfo'):
+		info = {}
+		with open('/proc/meminfo', 'r') as f:
+			for line in f:
+				parts = line.split()
+				if len(parts) >= 2:
+					info[parts[0].rstrip(':')] = int(parts[1])
+		if 'MemAvailable' in info:
+			return info['MemAvailable'] // 1024
+		if 'MemFree' in info:
+			return (info['MemFree'] + info.get('Cached', 0)) // 1024
+
+	if hasattr(os, 'sysconf'):
+		try:
+			return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+		except (ValueError, OSError):
+			pass
+
+	return None
+
+
+def plan_jobs(jobs, peak_rss_mb, reserve_mb=1024):
+	"""Limit jobs so that jobs * peak_rss_mb fits in the available memory"""
+	jobs = max(1, int(jobs))
+	if not peak_rss_mb:
+		return jobs
+
+	available = get_available_memory_mb()
+	if available is None:
+		return jobs
+
+	return max(1, min(jobs, int((available - reserve_mb) // peak_rss_mb)))
+
+
+def file_sha256(path):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+def get_download_cache_name(url, name):
+	"""File name for url inside the download cache and on the mirror"""
+	return '%s-%s' % (hashlib.sha1(url.encode('utf-8')).hexdigest()[:12], name)
+
+
+def get_cached_download(url, name, cache_dir):
+	"""Path of url in the download cache or None if it was not downloaded yet"""
+	cached = os.path.join(cache_dir, get_download_cache_name(url, name))
+	if os.path.exists(cached) and os.path.exists('%s.sha256' % cached):
+		return cached
+	return None
+
+
+def get_download_size(url, timeout=15):
+	"""Size of the file behind url from a HEAD request or None if unknown"""
+	import urllib.request
+	try:
+		request = urllib.request.Request(url, method='HEAD')
+		with urllib.request.urlopen(request, timeout=timeout) as response:
+			length = response.headers.get('Content-Length')
+			return int(length) if length else None
+	except Exception:
+		return None
+
+
+def is_valid_archive(path, name):
+	"""Can the archive be listed (type from name)? Catches error pages and other
+	files saved instead of the archive. Files that are not archives pass"""
+	if name.endswith('.zip'):
+		import zipfile
+		try:
+			with zipfile.ZipFile(path) as archive:
+				return archive.testzip() is None
+		except (zipfile.BadZipFile, OSError):
+			return False
+	if '.tar' in name or name.endswith(('.tgz', '.tbz2')):
+		return subprocess.call(['tar', '-tf', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+	return True
+
+
+def fetch_to_cache(url, name, cache_dir, mirror='', log_prefix=None):
+	"""Make sure the file from url is present in cache_dir.
+	A download is cached only if it is a valid archive (see is_valid_archive),
+	otherwise the next source is tried. The checksum stored next to a cached
+	file catches entries corrupted later. The downloads are not pinned to
+	known hashes. If mirror is set (url prefix or local directory) it is tried
+	before the original url, as <mirror>/<sha1(url)[:12]>-<name> and then <mirror>/<name>.
+	Returns the path of the cached file or None on failure"""
+	log_prefix = log_prefix if log_prefix else name
+	log = lambda msg: stdout_log_prefixed(log_prefix, msg)
+
+	cache_name = get_download_cache_name(url, name)
+	cached = os.path.join(cache_dir, cache_name)
+	checksum_file = '%s.sha256' % cached
+
+	# Parallel builds share the cache, only one of them downloads the file
+	with file_lock('%s.lock' % cached):
+		if os.path.exists(cached) and os.path.exists(checksum_file):
+			with open(checksum_file, 'r') as f:
+				stored = f.read().split()
+			# Entries cached before the archive check have only the hash, they are checked once
+			checked = stored[1:] == ['checked']
+			if stored and file_sha256(cached) == stored[0] and (checked or is_valid_archive(cached, name)):
+				if not checked:
+					write_file_atomic(checksum_file, '%s checked\n' % stored[0])
+				log('Using cached [%s]' % cached)
+				return cached
+			log('Cached [%s] is corrupted, will download again' % cached)
+			os.remove(cached)
+
+		partial = '%s.part' % cached
+		sources = [url]
+		if mirror:
+			mirror = mirror.rstrip('/')
+			sources[0:0] = ['%s/%s' % (mirror, cache_name), '%s/%s' % (mirror, name)]
+
+		downloaded = False
+		for source in sources:
+			if '://' not in source:
+				if not os.path.isfile(source):
+					continue
+				log('Copying [%s] from local mirror' % source)
+				shutil.copyfile(source, partial)
+				downloaded = True
+			else:
+				# Fail fast on dead urls instead of retrying for minutes
+				cmd = 'wget -c --timeout=60 --tries=3 "%s" -O %s' % (source, partial)
+				log(cmd)
+				downloaded = 0 == exec_prefixed(cmd, log_prefix, shell=True)
+			if downloaded and not is_valid_archive(partial, name):
+				log('[%s] is not a valid %s' % (source, name))
+				downloaded = False
+			if downloaded:
+				break
+			log('Failed to get [%s]' % source)
+			if os.path.exists(partial):
+				os.remove(partial)
+
+		if not downloaded:
+			return None
+
+		write_file_atomic(checksum_file, '%s checked\n' % file_sha256(partial))
+		os.rename(partial, cached)
+		return cached
+
+
+def download_cached(url, path, cache_dir, mirror='', log_prefix=None):
+	"""Place the file from url at path, going through cache_dir (see fetch_to_cache).
+	Returns True on success"""
+	cached = fetch_to_cache(url, os.path.basename(path), cache_dir, mirror, log_prefix)
+	if cached is None:
+		return False
+
+	if os.path.lexists(path):
+		os.remove(path)
+	try:
+		os.link(cached, path)
+	except OSError:
+		shutil.copyfile(cached, path)
+	return True
+
+
+@contextlib.contextmanager
+def file_lock(path):
+	"""Exclusive lock held on path between processes, no-op where fcntl is missing"""
+	try:
+		import fcntl
+	except ImportError:
+		yield
+		return
+
+	lock_dir = os.path.dirname(path)
+	if lock_dir and not os.path.isdir(lock_dir):
+		os.makedirs(lock_dir)
+	with open(path, 'a') as f:
+		fcntl.flock(f, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_git_mirror_dir():
+	"""Per host cache of bare mirrors, VB_GIT_MIRROR_DIR="" disables it"""
+	default = os.path.join(os.path.expanduser('~'), '.cache', 'vb-git-mirrors')
+	return os.environ.get('VB_GIT_MIRROR_DIR', default)
+
+
+def update_git_mirror(repo_url, log_prefix='GIT'):
+	"""Create or update the bare mirror of repo_url, it is used as --reference
+	when cloning so a new clone copies objects locally instead of fetching
+	the whole history. Returns the mirror path or None"""
+	mirror_root = get_git_mirror_dir()
+	if not mirror_root:
+		return None
+
+	repo_name = os.path.basename(repo_url.rstrip('/'))
+	mirror = os.path.join(mirror_root, '%s-%s' % (hashlib.sha1(repo_url.encode('utf-8')).hexdigest()[:12], repo_name))
+
+	with file_lock('%s.lock' % mirror):
+		if os.path.exists(mirror):
+			cmd = 'git --git-dir="%s" remote update --prune' % mirror
+		else:
+			cmd = 'git clone --mirror %s "%s"' % (repo_url, mirror)
+
+		stdout_log_prefixed(log_prefix, 'GIT: [%s]' % cmd)
+		if exec_prefixed(cmd, log_prefix, shell=True) != 0:
+			stderr_log('[%s] GIT: failed to update mirror [%s], cloning without it' % (log_prefix, mirror))
+			if not os.path.exists(os.path.join(mirror, 'HEAD')) and os.path.exists(mirror):
+				remove_directory(mirror)
+			return None
+
+	return mirror
+
+
+def get_git_clone_args(depth=0, filter_spec=''):
+	"""Arguments for shallow (depth) and / or partial (filter_spec, like blob:none)
+	clones. Fetches and submodule updates have to repeat them, or the full history
+	of refs not connected to the shallow history is downloaded"""
+	args = ''
+	if depth:
+		args += '--depth %d ' % depth
+	if filter_spec:
+		args += '--filter=%s ' % filter_spec
+	return args
+
+
+def get_git_local_commit(root, ref):
+	"""Hash of the commit ref points to or None if it is not present locally"""
+	res = _get_cmd_output_ex(['git', 'rev-parse', '--verify', '-q', '%s^{commit}' % ref], root)
+	return res['output'] if res['code'] == 0 and res['output'] else None
+
+
+def get_git_checkout_target(root, ref):
+	"""What to checkout for ref and if origin has to be fetched first.
+	Commit hashes and tags never move, so they are not fetched if present"""
+	is_hash = re.match(r'^[0-9a-f]{7,40}$', ref) is not None
+	if is_hash and get_git_local_commit(root, ref):
+		return ref, False
+	if get_git_local_commit(root, 'refs/tags/%s' % ref):
+		return 'refs/tags/%s' % ref, False
+	if is_hash:
+		return ref, True
+	return 'origin/%s' % ref, True
+
+
+def get_repo(repo_url, branch='master', target_dir=None, target_name=None, submodules=[], cwd=None, exit_on_error=True, jobs=1, depth=0, filter_spec='', reset='full'):
+	"""
+	This will clone the repo in cwd (CWD by default). If target_dir != None it will copy
+	the sources to target_dir. The process CWD is not changed and the output is prefixed
+	with the repo name, so several repos could be synced at the same time.
+	reset='incremental' keeps the working tree of an existing clone: fetch is skipped
+	if the requested commit / tag is present and only paths that differ are touched,
+	ignored files (build output) are kept.
+	Returns False on failure if exit_on_error is not set"""
 
 	repo_name = target_name if target_name is not None else os.path.basename(repo_url)
-	cwd = os.getcwd()
+	cwd = cwd if cwd else os.getcwd()
 	clone_dir = os.path.join(cwd, repo_name)
+	log = lambda msg: stdout_log_prefixed(repo_name, msg)
+
+	log("Repo [%s]" % repo_url)
 
-	git_cmds = []
-	dumpAndExec = lambda cmd: exec_and_log(cmd, 'GIT', True)
+	def dumpAndExec(cmd, cmd_cwd):
+		log('GIT: [%s] cwd(%s)' % (cmd, cmd_cwd))
+		if exec_prefixed(cmd, repo_name, cwd=cmd_cwd, shell=True) != 0:
+			stderr_log('[%s] GIT: command failed! [%s]' % (repo_name, cmd))
+			if exit_on_error:
+				sys.exit(2)
+			return False
+		return True
 
 	repo_dir_exists = os.path.exists(clone_dir)
 
 	if repo_dir_exists:
 		existing_url = get_git_remote_url(clone_dir)
-		sys.stderr.write('target_name "%s" exists [%s]\n' % (repo_name, clone_dir))
-		sys.stderr.write('\trequested url:[%s]\n\tpresent url:[%s]\n' % (repo_url, existing_url))
-		sys.stderr.flush()
+		log('target_name "%s" exists [%s]' % (repo_name, clone_dir))
+		log('\trequested url:[%s]\n\tpresent url:[%s]' % (repo_url, existing_url))
 		if existing_url != repo_url:
-			sys.stderr.write("Urls are different - removing [%s]\n" % clone_dir)
-			sys.stderr.flush()
+			log("Urls are different - removing [%s]" % clone_dir)
 			remove_directory(clone_dir)
 			repo_dir_exists = False
 
 	if not repo_dir_exists:
-		get_cmd = ""
+		clone_args = get_git_clone_args(depth, filter_spec)
+		# Shallow and partial clones are for short lived builders, there is no point in a mirror
+		mirror = update_git_mirror(repo_url, repo_name) if not clone_args else None
+		if mirror:
+			# --dissociate copies the borrowed objects, clone does not depend on the mirror
+			clone_args = '--reference "%s" --dissociate ' % mirror
+
 		if target_name and not target_dir:
 			# just rename clone
-			dumpAndExec("git clone %s %s" % (repo_url, target_name))
+			ok = dumpAndExec("git clone %s%s %s" % (clone_args, repo_url, target_name), cwd)
 		else:
-			dumpAndExec("git clone %s" % repo_url)
-
-	os.chdir(clone_dir)
-	git_cmds = git_cmds + [
-		"git fetch origin",
-		"git clean -ffd",
-		"git checkout -f origin/%s" % branch,
-		"git submodule foreach --recursive git clean -ffd",
-		"git clean -ffd",
-	]
-
-	for module in submodules:
-		git_cmds.append("git submodule update --force --init --recursive %s" % module)
+			ok = dumpAndExec("git clone %s%s" % (clone_args, repo_url), cwd)
+		if not ok:
+			return False
+
+	if reset == 'incremental':
+		target, need_fetch = get_git_checkout_target(clone_dir, branch)
+		git_cmds = []
+		if need_fetch:
+			git_cmds.append("git fetch %sorigin" % get_git_clone_args(depth, filter_spec))
+		else:
+			log('[%s] is present, skipping fetch' % branch)
+		# checkout -f only rewrites files that differ from the target
+		git_cmds += [
+			"git checkout -f %s" % target,
+			"git clean -fd",
+		]
+	else:
+		git_cmds = [
+			"git fetch %sorigin" % get_git_clone_args(depth, filter_spec),
+			"git clean -ffd",
+			"git checkout -f origin/%s" % branch,
+			"git submodule foreach --recursive git clean -ffd",
+			"git clean -ffd",
+		]
 
 	for cmd in git_cmds:
-		dumpAndExec(cmd)
+		if not dumpAndExec(cmd, clone_dir):
+			return False
+
+	if submodules:
+		if not update_git_submodules(clone_dir, submodules, jobs, get_git_clone_args(depth, filter_spec), log_prefix=repo_name):
+			stderr_log('[%s] GIT: submodule update failed!' % repo_name)
+			if exit_on_error:
+				sys.exit(2)
+			return False
 
 	if target_dir:
 		to_dir = os.path.join(target_dir, repo_name)
@@ -163,7 +545,26 @@ def get_repo(repo_url, branch='master', target_dir=None, target_name=None, submo
 
 		shutil.copytree(clone_dir, to_dir)
 
-	os.chdir(cwd)
+	return True
+
+
+def sync_repos(repos, cwd, jobs=3):
+	"""Run get_repo() for every dict of arguments in repos at the same time,
+	at most jobs repos at once. Returns True if all of them succeeded"""
+	def sync(repo):
+		start = time.time()
+		try:
+			ok = get_repo(cwd=cwd, exit_on_error=False, jobs=jobs, **repo)
+		except Exception as e:
+			stderr_log('Exception while syncing [%s]: %s' % (repo['repo_url'], e))
+			ok = False
+		stdout_log('Repo [%s] %s in %.1fs' % (repo['repo_url'], 'synced' if ok else 'FAILED', time.time() - start))
+		return ok
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+		results = list(pool.map(sync, repos))
+
+	return all(results)
 
 
 def get_host_architecture():
@@ -206,6 +607,102 @@ def path_create(path):
 		os.makedirs(path)
 
 
+_umask = None
+
+
+def get_umask():
+	"""Process umask, read once (it can only be read by setting it)"""
+	global _umask
+	if _umask is None:
+		_umask = os.umask(0o022)
+		os.umask(_umask)
+	return _umask
+
+
+def write_file_atomic(path, text):
+	"""Write text to path so readers see either the old or the new content,
+	never a partially written file. The file gets the umask permissions
+	like a plain open() would, not the 0600 of the temporary file"""
+	dirname = os.path.dirname(path)
+	if dirname and not os.path.isdir(dirname):
+		os.makedirs(dirname)
+	fd, tmp = tempfile.mkstemp(dir=dirname or '.', prefix='.%s.' % os.path.basename(path))
+	with os.fdopen(fd, 'w') as f:
+		f.write(text)
+		f.flush()
+		os.fsync(f.fileno())
+	os.chmod(tmp, 0o666 & ~get_umask())
+	os.replace(tmp, path)
+
+
+def copy_if_changed(src, dst, keep_mtime=True):
+	"""Copy src to dst (with its mtime unless keep_mtime is False) only if the
+	contents differ, so unchanged files keep their mtime. Returns True if dst was written"""
+	if os.path.isfile(dst) and not os.path.islink(dst) and os.path.getsize(src) == os.path.getsize(dst):
+		if filecmp.cmp(src, dst, shallow=False):
+			return False
+	elif os.path.isdir(dst) and not os.path.islink(dst):
+		shutil.rmtree(dst)
+	elif os.path.lexists(dst):
+		os.remove(dst)
+
+	dst_dir = os.path.dirname(dst)
+	if dst_dir and not os.path.isdir(dst_dir):
+		os.makedirs(dst_dir)
+	if keep_mtime:
+		shutil.copy2(src, dst)
+	else:
+		shutil.copyfile(src, dst)
+	return True
+
+
+def git_release_skip_worktree(root, target):
+	"""Clear the skip-worktree flag of the files that differ between HEAD
+	and target, so checking out target can update them. Files unchanged
+	upstream keep the flag and their local contents"""
+	skipped = [line[2:] for line in _get_cmd_output(['git', 'ls-files', '-v'], root).splitlines() if line.startswith('S ')]
+	if not skipped:
+		return
+	changed = _get_cmd_output(['git', 'diff', '--name-only', 'HEAD', target, '--'] + skipped, root).splitlines()
+	if changed:
+		subprocess.call(['git', 'update-index', '-q', '--no-skip-worktree', '--'] + changed, cwd=root)
+
+
+def sync_tree(src, dst, exclude=('.git',)):
+	"""Make dst a copy of src writing only changed files and removing
+	the ones missing in src. Names in exclude are skipped on both sides.
+	Returns (number of copied files, number of removed paths)"""
+	copied, removed = 0, 0
+	for dirpath, dirnames, filenames in os.walk(src):
+		dirnames[:] = [d for d in dirnames if d not in exclude]
+		rel = os.path.relpath(dirpath, src)
+		dst_dir = os.path.normpath(os.path.join(dst, rel))
+
+		if os.path.lexists(dst_dir) and not os.path.isdir(dst_dir):
+			os.remove(dst_dir)
+		if not os.path.isdir(dst_dir):
+			os.makedirs(dst_dir)
+
+		names = set(dirnames) | set(f for f in filenames if f not in exclude)
+		for name in os.listdir(dst_dir):
+			if name in names or name in exclude:
+				continue
+			path = os.path.join(dst_dir, name)
+			if os.path.isdir(path) and not os.path.islink(path):
+				shutil.rmtree(path)
+			else:
+				os.remove(path)
+			removed += 1
+
+		for name in filenames:
+			if name in exclude:
+				continue
+			if copy_if_changed(os.path.join(dirpath, name), os.path.join(dst_dir, name)):
+				copied += 1
+
+	return copied, removed
+
+
 def dir_contents_recursive(path):
 	res = []
 	for dirpath, dirnames, filenames in os.walk(path):
@@ -268,6 +765,215 @@ def pathExpand(path):
 	return path
 
 
+COMPILER_CACHES = ('ccache', 'sccache')
+
+
+def get_compiler_cache(tool):
+	"""Path of the compiler cache launcher: tool is one of COMPILER_CACHES,
+	'auto' for the first one found or 'none'. None if it's disabled or missing"""
+	if tool == 'none':
+		return None
+	for name in (COMPILER_CACHES if tool == 'auto' else (tool,)):
+		path = shutil.which(name)
+		if path:
+			return path
+	if tool != 'auto':
+		stderr_log('Compiler cache %s is not found, building without it' % tool)
+	return None
+
+
+def get_compiler_cache_env(launcher, cache_dir='', max_size='', base_dir='', cmake_launcher=True):
+	"""Environment for the compiler cache. ccache rewrites absolute paths under
+	base_dir, so different checkouts of the same sources share cache entries.
+	With cmake_launcher CMAKE_<LANG>_COMPILER_LAUNCHER is set, it is picked up
+	by CMake >= 3.17 (see get_cmake_version)"""
+	env = {}
+	if cmake_launcher:
+		env['CMAKE_C_COMPILER_LAUNCHER'] = launcher
+		env['CMAKE_CXX_COMPILER_LAUNCHER'] = launcher
+	if os.path.basename(launcher).startswith('sccache'):
+		if cache_dir:
+			env['SCCACHE_DIR'] = cache_dir
+		if max_size:
+			env['SCCACHE_CACHE_SIZE'] = max_size
+	else:
+		if cache_dir:
+			env['CCACHE_DIR'] = cache_dir
+		if max_size:
+			env['CCACHE_MAXSIZE'] = max_size
+		if base_dir:
+			env['CCACHE_BASEDIR'] = base_dir
+	return env
+
+
+def get_compiler_cache_bin_dir(launcher):
+	"""Directory with cc / gcc / g++ ... links to ccache, prepended to PATH it
+	caches builds that don't use CMake (autoconf, plain make). sccache can't be
+	used this way, None is returned for it"""
+	if os.path.basename(launcher).startswith('sccache'):
+		return None
+	bin_dir = os.path.join(os.path.expanduser('~'), '.cache', 'vb-compiler-cache-bin')
+	os.makedirs(bin_dir, exist_ok=True)
+	path = os.pathsep.join(p for p in os.environ.get('PATH', '').split(os.pathsep) if os.path.abspath(p) != bin_dir)
+	for name in ('cc', 'c++', 'gcc', 'g++', 'clang', 'clang++'):
+		link = os.path.join(bin_dir, name)
+		# Only for installed compilers, otherwise configure scripts would pick the link
+		wanted = shutil.which(name, path=path) is not None
+		if os.path.lexists(link) and (not wanted or os.readlink(link) != launcher):
+			os.remove(link)
+		if wanted and not os.path.lexists(link):
+			os.symlink(launcher, link)
+	return bin_dir
+
+
+def get_cmake_version(cmake='cmake'):
+	"""CMake version as a tuple of ints, None if cmake can't be run"""
+	try:
+		output = subprocess.check_output([cmake, '--version'], stderr=subprocess.DEVNULL).decode(errors='replace')
+	except (OSError, subprocess.CalledProcessError):
+		return None
+	match = re.search(r'version (\d+)\.(\d+)(?:\.(\d+))?', output)
+	if not match:
+		return None
+	return tuple(int(v) for v in match.groups('0'))
+
+
+def compiler_cache_stats(launcher, env=None, zero=False):
+	"""Reset (zero=True) or print the hit / miss statistics"""
+	cmd = [launcher, '--zero-stats' if zero else '--show-stats']
+	if not zero:
+		sys.stdout.write('Compiler cache statistics:\n')
+		sys.stdout.flush()
+	subprocess.call(cmd, env=env, stdout=subprocess.DEVNULL if zero else None)
+
+
+LINKERS = ('lld', 'gold', 'bfd')
+
+
+def compiler_supports_linker(cc, linker):
+	"""Can cc link with -fuse-ld=linker"""
+	try:
+		return subprocess.call([cc, '-fuse-ld=%s' % linker, '-Wl,--version'],
+							   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+	except OSError:
+		return False
+
+
+def detect_linker(cc, linker='auto'):
+	"""linker if cc supports it, for 'auto' the fastest supported one of LINKERS.
+	Falls back to 'bfd', the default linker"""
+	for name in (LINKERS if linker == 'auto' else (linker,)):
+		if name == 'bfd' or compiler_supports_linker(cc, name):
+			return name
+	stderr_log('%s can not link with %s, using the default linker' % (cc, linker))
+	return 'bfd'
+
+
+def separate_debug_info(binary, debug_dir):
+	"""Move the debug info of binary to debug_dir/<name>.debug and link it back
+	with .gnu_debuglink, so debuggers still find it. Returns the .debug path or None"""
+	debug_file = os.path.join(debug_dir, '%s.debug' % os.path.basename(binary))
+	os.makedirs(debug_dir, exist_ok=True)
+	for cmd in (['objcopy', '--only-keep-debug', '--compress-debug-sections', binary, debug_file],
+				['objcopy', '--strip-debug', '--add-gnu-debuglink=%s' % debug_file, binary]):
+		if subprocess.call(cmd) != 0:
+			stderr_log('Failed to separate debug info of %s' % binary)
+			return None
+	return debug_file
+
+
+def read_ninja_log(path):
+	"""Latest .ninja_log entry of every output: {output: (start ms, end ms, command hash)}.
+	Empty if there is no log"""
+	entries = {}
+	if not os.path.isfile(path):
+		return entries
+	with open(path, 'r', errors='replace') as f:
+		for line in f:
+			if line.startswith('#'):
+				continue
+			parts = line.rstrip('\n').split('\t')
+			if len(parts) != 5:
+				continue
+			start, end, mtime, output, cmdhash = parts
+			entries[output] = (int(start), int(end), cmdhash)
+	return entries
+
+
+def get_ninja_target_kind(output):
+	"""'compile', 'link' or 'other' (generated sources, custom commands)"""
+	name = output.lower()
+	if name.endswith(('.o', '.obj')):
+		return 'compile'
+	if re.search(r'(\.(a|lib|dll|exe|dylib|so)(\.\d+)*|/[^./]+)$', '/' + name):
+		return 'link'
+	return 'other'
+
+
+def read_ninja_graph(build_dir, filename='build.ninja'):
+	"""{output: [inputs]} of every build statement in build.ninja and the files
+	it includes, implicit and order-only inputs included"""
+	escapes = (('$$', '\0d'), ('$ ', '\0s'), ('$:', '\0c'))
+
+	def unescape(token):
+		return token.replace('\0d', '$').replace('\0s', ' ').replace('\0c', ':')
+
+	graph = {}
+
+	def parse(path):
+		if not os.path.isfile(path):
+			return
+		with open(path, 'r', errors='replace') as f:
+			text = re.sub(r'\$\n\s*', ' ', f.read())
+		for line in text.split('\n'):
+			if line.startswith('build '):
+				for escape, marker in escapes:
+					line = line.replace(escape, marker)
+				outputs, sep, rest = line[len('build '):].partition(':')
+				inputs = [unescape(t) for t in rest.split()[1:] if t not in ('|', '||', '|@')]
+				for output in outputs.split():
+					if output != '|':
+						graph[unescape(output)] = inputs
+			elif line.startswith(('include ', 'subninja ')):
+				parse(os.path.join(build_dir, line.split(None, 1)[1].strip()))
+
+	parse(os.path.join(build_dir, filename))
+	return graph
+
+
+def get_ninja_critical_path(graph, durations):
+	"""Longest chain of dependent steps weighted by durations (ms, outputs
+	missing in durations weight 0). Returns (length in ms, [outputs from first to last])"""
+	memo = {}
+	for root in durations:
+		stack = [(root, False)]
+		while stack:
+			node, expanded = stack.pop()
+			if node in memo:
+				continue
+			inputs = graph.get(node, ())
+			if not expanded:
+				stack.append((node, True))
+				stack.extend((i, False) for i in inputs if i not in memo)
+				continue
+			best = max(inputs, key=lambda i: memo.get(i, (0,))[0], default=None)
+			length = durations.get(node, 0) + (memo.get(best, (0,))[0] if best is not None else 0)
+			memo[node] = (length, best)
+
+	if not memo:
+		return 0, []
+
+	node = max(durations, key=lambda o: memo[o][0])
+	length = memo[node][0]
+	chain = []
+	while node is not None:
+		if durations.get(node):
+			chain.append(node)
+		node = memo.get(node, (0, None))[1]
+	chain.reverse()
+	return length, chain
+
+
 def which(program, add_ext=False):
 	"""
 	  Returns full path of "program" or None, if it fails will print where it tried
@@ -411,27 +1117,21 @@ def _get_cmd_output_ex(cmd, workDir=None):
 	logDir = workDir if workDir is not None else 'None(%s)' % os.getcwd()
 	sys.stdout.write('Executing [%s] inside [%s]\n' % (' '.join(cmd), logDir))
 	sys.stdout.flush()
-	pwd = os.getcwd()
-	if workDir:
-		os.chdir(workDir)
 
 	res = "None"
 	code = 0
 	if hasattr(subprocess, "check_output"):
 		try:
-			res = subprocess.check_output(cmd)
+			res = subprocess.check_output(cmd, cwd=workDir)
 		except subprocess.CalledProcessError as e:
 			code = e.returncode
 			res = e.output
 	else:
-		proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+		proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=workDir)
 		res = proc.communicate()[0]
 		code = proc.returncode
 	res = res.decode().strip(" \n\r\t")
 
-	if workDir:
-		os.chdir(pwd)
-
 	return {'code': code, 'output': res}
 
 
@@ -439,7 +1139,88 @@ def _get_cmd_output(cmd, workDir=None):
 	return _get_cmd_output_ex(cmd, workDir)['output']
 
 
+def get_git_dirs(root):
+	"""(git dir, common git dir) of the repo or worktree at root, they differ
+	only for worktrees. (None, None) if root is not a git checkout"""
+	dot_git = os.path.join(root, '.git')
+	if os.path.isdir(dot_git):
+		git_dir = dot_git
+	elif os.path.isfile(dot_git):
+		with open(dot_git, 'r') as f:
+			content = f.read().strip()
+		if not content.startswith('gitdir:'):
+			return None, None
+		git_dir = os.path.normpath(os.path.join(root, content[len('gitdir:'):].strip()))
+	else:
+		return None, None
+
+	common_dir = git_dir
+	commondir_file = os.path.join(git_dir, 'commondir')
+	if os.path.isfile(commondir_file):
+		with open(commondir_file, 'r') as f:
+			common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+	return git_dir, common_dir
+
+
+def read_git_ref(root, ref):
+	"""Hash ref (HEAD or a full ref name) points to, read straight from
+	the ref files without running git. None if it can't be resolved this way"""
+	git_dir, common_dir = get_git_dirs(root)
+	if git_dir is None:
+		return None
+
+	# Follow symbolic refs like HEAD -> refs/heads/master
+	for i in range(5):
+		value = None
+		ref_file = os.path.join(git_dir if ref == 'HEAD' else common_dir, *ref.split('/'))
+		if os.path.isfile(ref_file):
+			with open(ref_file, 'r') as f:
+				value = f.read().strip()
+		else:
+			packed_refs = os.path.join(common_dir, 'packed-refs')
+			if os.path.isfile(packed_refs):
+				with open(packed_refs, 'r') as f:
+					for line in f:
+						parts = line.strip().split(' ')
+						if len(parts) == 2 and parts[1] == ref:
+							value = parts[0]
+							break
+
+		if value is None:
+			return None
+		if value.startswith('ref:'):
+			ref = value[len('ref:'):].strip()
+			continue
+		return value if re.match(r'^[0-9a-f]{40,64}$', value) else None
+
+	return None
+
+
+def read_git_config_value(root, section, subsection, key):
+	"""Value of [section "subsection"] key from the repo config, without running git"""
+	git_dir, common_dir = get_git_dirs(root)
+	if common_dir is None or not os.path.isfile(os.path.join(common_dir, 'config')):
+		return None
+
+	current = None
+	with open(os.path.join(common_dir, 'config'), 'r') as f:
+		for line in f:
+			line = line.strip()
+			match = re.match(r'^\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]$', line)
+			if match:
+				current = (match.group(1).lower(), match.group(2))
+				continue
+			match = re.match(r'^([\w-]+)\s*=\s*(.*)$', line)
+			if match and current == (section.lower(), subsection) and match.group(1).lower() == key.lower():
+				return match.group(2).strip()
+	return None
+
+
 def get_git_remote_url(root):
+	url = read_git_config_value(root, 'remote', 'origin', 'url')
+	if url:
+		return url
+
 	get_remote = ['git', 'remote', '-v']
 	lines = _get_cmd_output(get_remote, workDir=root).split('\n')
 	sys.stdout.write('get_git_remote_url(%s):\n%s\n\n' % (root, lines))
@@ -457,23 +1238,126 @@ def get_git_head_hash(root):
 	return _get_cmd_output(git_rev, root)
 
 
-def get_svn_revision(svn_root):
-	b_rev   = ['git', 'rev-parse', '--short', 'github/master']
-	git_cnt = ['git', 'rev-list',  '--count', 'HEAD']
+def is_git_worktree_of(path, repo_dir):
+	"""Is path a worktree added with 'git worktree add' to repo_dir"""
+	if not os.path.isfile(os.path.join(path, '.git')):
+		return False
+	git_dir, common_dir = get_git_dirs(path)
+	worktrees_dir = os.path.normpath(os.path.join(repo_dir, '.git', 'worktrees'))
+	return git_dir is not None and git_dir.startswith(worktrees_dir + os.sep) and os.path.isdir(git_dir)
+
+
+def get_git_submodules(root):
+	"""List of (name, path) of the submodules in root/.gitmodules"""
+	gitmodules = os.path.join(root, '.gitmodules')
+	if not os.path.exists(gitmodules):
+		return []
+	cmd = ['git', 'config', '-f', gitmodules, '--get-regexp', r'^submodule\..*\.path$']
+	submodules = []
+	for line in _get_cmd_output(cmd, root).split('\n'):
+		match = re.match(r'submodule\.(.+)\.path\s+(.+)', line.strip())
+		if match:
+			submodules.append(match.groups())
+	return submodules
+
+
+def is_git_shallow(root):
+	return _get_cmd_output(['git', 'rev-parse', '--is-shallow-repository'], root) == 'true'
+
+
+def get_git_commit_count(root, unshallow=False):
+	"""Number of commits of HEAD and whether it is exact. A shallow clone only
+	counts its own history, unless unshallow is set: then the commits (no trees
+	or blobs) are fetched, which is slow on big repos"""
+	if not is_git_shallow(root):
+		return _get_cmd_output(['git', 'rev-list', '--count', 'HEAD'], root), True
+
+	if unshallow:
+		for remote in _get_cmd_output(['git', 'remote'], root).split():
+			stdout_log('Shallow repo [%s], fetching commit history from [%s] for the commit count' % (root, remote))
+			unshallow_cmd = ['git', 'fetch', '--unshallow', '--filter=tree:0', remote]
+			if _get_cmd_output_ex(unshallow_cmd, root)['code'] == 0 and not is_git_shallow(root):
+				return _get_cmd_output(['git', 'rev-list', '--count', 'HEAD'], root), True
+		stderr_log('Failed to get the history of [%s], the commit count is not exact' % root)
+	else:
+		stderr_log('Shallow repo [%s], the commit count is not exact (see --commit_count and --git_unshallow_count)' % root)
+
+	return _get_cmd_output(['git', 'rev-list', '--count', 'HEAD'], root), False
+
+
+def _run_per_submodule(paths, run, jobs, log_prefix):
+	"""Call run(path) for every submodule path at the same time (at most jobs at once)
+	and report how long each one took. Returns True if all of them succeeded"""
+	start = time.time()
+
+	def job(path):
+		job_start = time.time()
+		try:
+			ok = run(path)
+		except Exception as e:
+			stderr_log('[%s] Exception in submodule [%s]: %s' % (log_prefix, path, e))
+			ok = False
+		stdout_log_prefixed(log_prefix, 'Submodule [%s] %s in %.1fs' % (path, 'done' if ok else 'FAILED', time.time() - job_start))
+		return ok
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+		results = list(pool.map(job, paths))
+
+	stdout_log_prefixed(log_prefix, '%d submodules in %.1fs' % (len(paths), time.time() - start))
+	return all(results)
+
+
+def update_git_submodules(root, paths=None, jobs=4, args='', git_config='', log_prefix='git'):
+	"""Init submodules of root (all or only paths) one by one, the config writes
+	would collide, then update each of them in its own job. args are added to
+	'git submodule update' (like get_git_clone_args()), git_config goes before
+	the 'submodule' command (-c options)"""
+	if paths is None:
+		paths = [path for name, path in get_git_submodules(root)]
+	if not paths:
+		return True
 
-	rev = get_git_head_hash(svn_root)
-	brev = _get_cmd_output(b_rev, svn_root)
-	cnt = _get_cmd_output(git_cnt, svn_root)
+	init = 'git %s submodule init -- %s' % (git_config, ' '.join(paths))
+	if exec_prefixed(init, log_prefix, cwd=root, shell=True) != 0:
+		return False
 
-	return rev, brev, cnt
+	def update(path):
+		cmd = 'git %s submodule update --init --recursive --force %s-- %s' % (git_config, args, path)
+		return exec_prefixed(cmd, '%s/%s' % (log_prefix, path), cwd=root, shell=True) == 0
 
+	return _run_per_submodule(paths, update, jobs, log_prefix)
+
+
+def foreach_git_submodule(root, cmd, jobs=4, log_prefix='git'):
+	"""Concurrent 'git submodule foreach cmd' for the checked out submodules of root"""
+	paths = [path for name, path in get_git_submodules(root) if os.path.exists(os.path.join(root, path, '.git'))]
+
+	def run(path):
+		return exec_prefixed(cmd, '%s/%s' % (log_prefix, path), cwd=os.path.join(root, path), shell=True) == 0
+
+	return _run_per_submodule(paths, run, jobs, log_prefix)
+
+
+def get_svn_revision(svn_root):
+	info = get_revision_info(svn_root)
+	return info['revision'], info['brev'], info['commits']
+
+
+_blender_version_cache = {}
 
 def get_blender_version(root_dir):
+	"""(version, major, minor, sub, char) from BKE_blender_version.h,
+	the header is parsed once per modification"""
 	BKE_blender_h_path = path_join(root_dir, "source", "blender", "blenkernel", "BKE_blender_version.h")
 	if not os.path.exists(BKE_blender_h_path):
 		return VERSION
 
-	BKE_blender_h = open(BKE_blender_h_path,'r').readlines()
+	cache_key = (BKE_blender_h_path, os.path.getmtime(BKE_blender_h_path))
+	if cache_key in _blender_version_cache:
+		return _blender_version_cache[cache_key]
+
+	with open(BKE_blender_h_path, 'r') as f:
+		BKE_blender_h = f.readlines()
 
 	ver     = VERSION
 
@@ -499,7 +1383,77 @@ def get_blender_version(root_dir):
 			if len(verChar) > 1:
 				verChar = ""
 
-	return (ver, verMaj, verMin, verSub, verChar)
+	_blender_version_cache[cache_key] = (ver, verMaj, verMin, verSub, verChar)
+	return _blender_version_cache[cache_key]
+
+
+_revision_info_cache = {}
+
+def get_revision_info(root, from_git=True, commit_count='', unshallow=False, count_root=None):
+	"""Everything the package names and build info need about the sources at root:
+	{'revision', 'brev', 'commits', 'version', 'versionArr'}.
+	Refs are read straight from the git dir, only the commit count runs git and
+	it is stored per HEAD in the git dir of count_root (default root; pass a repo
+	that outlives root, like blender-git for an exported copy), so it's computed
+	once per revision. commit_count (from the build server) is used instead of
+	counting, unshallow is passed to get_git_commit_count"""
+	head = read_git_ref(root, 'HEAD') if from_git else None
+	if from_git and head is None:
+		head = _get_cmd_output(['git', 'rev-parse', 'HEAD'], root)
+
+	cache_key = (os.path.abspath(root), head)
+	if cache_key in _revision_info_cache:
+		return _revision_info_cache[cache_key]
+
+	version = get_blender_version(root)
+	info = {
+		'revision'   : REVISION,
+		'brev'       : "",
+		'commits'    : '0',
+		'version'    : version[0],
+		'versionArr' : version,
+	}
+
+	if from_git:
+		brev = read_git_ref(root, 'refs/remotes/github/master')
+		if brev is None:
+			brev = _get_cmd_output(['git', 'rev-parse', 'github/master'], root)
+
+		git_dir, common_dir = get_git_dirs(count_root if count_root else root)
+		count_file = os.path.join(common_dir, 'vb-commit-count') if common_dir else None
+		counts = []
+		if count_file and os.path.isfile(count_file):
+			with open(count_file, 'r') as f:
+				counts = [line.split() for line in f if len(line.split()) == 2]
+		commits = dict(counts).get(head)
+		if commit_count:
+			commits = str(commit_count)
+		if commits is None:
+			commits, exact = get_git_commit_count(root, unshallow)
+			if count_file and exact:
+				# One line per HEAD, the most recent ones are kept
+				counts = [c for c in counts if c[0] != head][-31:] + [[head, commits]]
+				write_file_atomic(count_file, ''.join('%s %s\n' % tuple(c) for c in counts))
+
+		# Same abbreviation as 'git rev-parse --short' (core.abbrev, grows with the repo)
+		abbrev = len(get_git_head_hash(root)) or 7
+		info.update({
+			'revision' : head[:abbrev],
+			'brev'     : brev[:abbrev],
+			'commits'  : commits,
+		})
+
+	_revision_info_cache[cache_key] = info
+	return info
+
+
+def get_remote_branch_hash(repo_url, branch):
+	"""Hash of branch on the remote (git ls-remote), cached for the run"""
+	cache_key = ('ls-remote', repo_url, branch)
+	if cache_key not in _revision_info_cache:
+		output = _get_cmd_output(['git', 'ls-remote', repo_url, branch])
+		_revision_info_cache[cache_key] = re.split(r'\s+', output)[0]
+	return _revision_info_cache[cache_key]
 
 
 def get_linux_distribution():
@@ -644,17 +1598,14 @@ def GetInstallDirName(self):
 	if self.add_branch_name:
 		branchID = "-%s" % self.use_github_branch.split("/")[-1]
 
-	version  = self.version
-	project  = self.project
-	nCommits = self.commits
-	arch     = self.build_arch
+	info = self.revision_info
 
 	params = {
 		'project'  : self.project,
-		'version'  : "-%s" % self.version,
-		'nCommits' : "-%s" % self.commits,
-		'hash'     : "-%s" % self.revision,
-		'bhash'    : "-%s" % self.brev,
+		'version'  : "-%s" % info['version'],
+		'nCommits' : "-%s" % info['commits'],
+		'hash'     : "-%s" % info['revision'],
+		'bhash'    : "-%s" % info['brev'],
 		'arch'     : "-%s" % self.build_arch,
 		'branch'   : branchID,
 	}
@@ -669,7 +1620,7 @@ def GetInstallDirName(self):
 		params.update({
 			'bhash' : "",
 			'nCommits' : "",
-			'hash'     : "-%s" % self.revision[:7],
+			'hash'     : "-%s" % info['revision'][:7],
 		})
 
 	sys.stdout.write('GetInstallDirName params: \n%s\n' % str(params))
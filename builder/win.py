@@ -85,58 +85,44 @@ class WindowsBuilder(Builder):
 			os.environ['PATH'] = utils.path_join(self.patch_dir, "tools")
 			self.setup_msvc_2013(self.jenkins_kdrive_path)
 
-		cmake.append("-DCMAKE_BUILD_TYPE=%s" % self.build_type.capitalize())
-		cmake.append('-DCMAKE_INSTALL_PREFIX=%s' % self.dir_install_path)
-
-		cmake.append("-DWITH_VRAY_FOR_BLENDER=ON")
-		cmake.append("-DWITH_MANUAL_BUILDINFO=%s" % utils.GetCmakeOnOff(self.teamcity or self.jenkins))
+		cmake.append(self.dir_blender)
 
-		if self.build_mode == 'nightly':
-			cmake.append("-DLIBS_ROOT=%s" % utils.path_join(self.dir_source, 'blender-for-vray-libs'))
+		cache = self.get_cmake_cache()
+		cache.update(self.setup_compiler_cache())
 
 		if self.jenkins_minimal_build:
-			cmake.append("-DWITH_GAMEENGINE=OFF")
-			cmake.append("-DWITH_PLAYER=OFF")
-			cmake.append("-DWITH_LIBMV=OFF")
-			cmake.append("-DWITH_OPENCOLLADA=OFF")
-			cmake.append("-DWITH_CYCLES=OFF")
-			cmake.append("-DWITH_MOD_OCEANSIM=OFF")
-			cmake.append("-DWITH_OPENSUBDIV=OFF")
-			cmake.append("-DWITH_FFTW3=OFF")
-			cmake.append("-DWITH_ALEMBIC=OFF")
-			cmake.append("-DWITH_INPUT_NDOF=OFF")
-			cmake.append("-DWITH_MOD_FLUID=OFF")
-			cmake.append("-DWITH_MOD_REMESH=OFF")
-			cmake.append("-DWITH_MOD_BOOLEAN=OFF")
-			cmake.append("-DWITH_CODEC_FFMPEG=OFF")
-			cmake.append("-DWITH_CODEC_AVI=OFF")
+			cache.set("WITH_GAMEENGINE", False)
+			cache.set("WITH_PLAYER", False)
+			cache.set("WITH_LIBMV", False)
+			cache.set("WITH_OPENCOLLADA", False)
+			cache.set("WITH_CYCLES", False)
+			cache.set("WITH_MOD_OCEANSIM", False)
+			cache.set("WITH_OPENSUBDIV", False)
+			cache.set("WITH_FFTW3", False)
+			cache.set("WITH_ALEMBIC", False)
+			cache.set("WITH_INPUT_NDOF", False)
+			cache.set("WITH_MOD_FLUID", False)
+			cache.set("WITH_MOD_REMESH", False)
+			cache.set("WITH_MOD_BOOLEAN", False)
+			cache.set("WITH_CODEC_FFMPEG", False)
+			cache.set("WITH_CODEC_AVI", False)
+			# Left to the cmake defaults in the minimal build
+			for name in ("WITH_INTERNATIONAL", "WITH_PYTHON_INSTALL", "WITH_PYTHON_INSTALL_NUMPY"):
+				cache.unset(name)
 		else:
-			cmake.append("-DWITH_INTERNATIONAL=ON")
-			cmake.append("-DWITH_PYTHON_INSTALL=ON")
-			cmake.append("-DWITH_PYTHON_INSTALL_NUMPY=ON")
-			cmake.append("-DWITH_GAMEENGINE=%s" % utils.GetCmakeOnOff(self.with_ge))
-			cmake.append("-DWITH_PLAYER=%s" % utils.GetCmakeOnOff(self.with_player))
-			cmake.append("-DWITH_LIBMV=%s" % utils.GetCmakeOnOff(self.with_tracker))
-			cmake.append("-DWITH_OPENCOLLADA=%s" % utils.GetCmakeOnOff(self.with_collada))
-			cmake.append("-DWITH_CYCLES=%s" % utils.GetCmakeOnOff(self.with_cycles))
 			if self.with_cycles:
-				cmake.append("-DWITH_LLVM=ON")
-				cmake.append("-DWITH_CYCLES_OSL=ON")
-				# cmake.append("-DWITH_CYCLES_CUDA=ON")
-				# cmake.append("-DWITH_CYCLES_CUDA_BINARIES=ON")
-			cmake.append("-DWITH_MOD_OCEANSIM=ON")
-			cmake.append("-DWITH_OPENSUBDIV=ON")
-			cmake.append("-DWITH_FFTW3=ON")
-			cmake.append("-DWITH_ALEMBIC=ON")
-			cmake.append("-DWITH_INPUT_NDOF=ON")
-
-		cmake.append(self.dir_blender)
+				cache.set("WITH_LLVM", True)
+				cache.set("WITH_CYCLES_OSL", True)
+				# cache.set("WITH_CYCLES_CUDA", True)
+				# cache.set("WITH_CYCLES_CUDA_BINARIES", True)
+			cache.set("WITH_OPENSUBDIV", True)
 
 		sys.stdout.write('PATH:\n\t%s\n' % '\n\t'.join(os.environ['PATH'].split(';')))
 		sys.stdout.write('cmake args:\n%s\n' % '\n\t'.join(cmake))
+		sys.stdout.write('cmake cache:\n%s\n' % cache.text())
 		sys.stdout.flush()
 
-		res = subprocess.call(cmake)
+		res = self.configure(cmake, cmake_build_dir, cache)
 		if not res == 0:
 			sys.stderr.write("There was an error during configuration!\n")
 			sys.exit(1)
@@ -146,10 +132,13 @@ class WindowsBuilder(Builder):
 		ninja = utils.path_join(self.patch_dir, "tools", "ninja.exe")
 
 		make = [ninja]
-		make.append('-j%s' % self.build_jobs)
-		make.append('install')
+		make.extend(self.get_ninja_jobs_args())
 
+		ninjaLog = utils.read_ninja_log(os.path.join(cmake_build_dir, '.ninja_log'))
 		res = subprocess.call(make)
+		self.report_ninja_build(cmake_build_dir, ninjaLog)
+		if res == 0:
+			res = self.install_build(cmake_build_dir)
 		if not res == 0:
 			sys.stderr.write("There was an error during the compilation!\n")
 			sys.exit(1)
@@ -123,20 +123,32 @@ def main(args):
         'release/datafiles/locale', # WITH_INTERNATIONAL
     ]
 
-    os.chdir(dir_source)
-    utils.remove_directory(os.path.join(dir_source, 'blender'))
-    utils.get_repo('git@github.com:ChaosGroup/blender_with_vray_additions',
-                   branch=blender_branch,
-                   submodules=blender_modules,
-                   target_name='blender')
-
-    utils.get_repo('ssh://gitolite@mantis.chaosgroup.com:2047/vray_for_blender_libs',
-                   target_name='blender-for-vray-libs')
-
-    utils.get_repo('ssh://gitolite@mantis.chaosgroup.com:2047/vray_for_blender_server.git',
-                   branch=args.jenkins_zmq_branch,
-                   submodules=['extern/vray-zmq-wrapper'],
-                   target_name='vrayserverzmq')
+    incremental = args.jenkins_reset_mode == 'incremental'
+    if not incremental:
+        utils.remove_directory(os.path.join(dir_source, 'blender'))
+    repos = [
+        dict(repo_url='git@github.com:ChaosGroup/blender_with_vray_additions',
+             branch=blender_branch,
+             submodules=blender_modules,
+             target_name='blender'),
+        dict(repo_url='ssh://gitolite@mantis.chaosgroup.com:2047/vray_for_blender_libs',
+             target_name='blender-for-vray-libs'),
+        dict(repo_url='ssh://gitolite@mantis.chaosgroup.com:2047/vray_for_blender_server.git',
+             branch=args.jenkins_zmq_branch,
+             submodules=['extern/vray-zmq-wrapper'],
+             target_name='vrayserverzmq'),
+    ]
+    for repo in repos:
+        repo['reset'] = args.jenkins_reset_mode
+
+    # All repos are synced at the same time, each log line is prefixed with the repo name
+    sync_start = time.time()
+    if not utils.sync_repos(repos, dir_source, jobs=args.jenkins_git_jobs):
+        sys.stderr.write('Failed to sync repositories!\n')
+        sys.stderr.flush()
+        return 1
+    sys.stdout.write('Repositories synced in %.1fs\n' % (time.time() - sync_start))
+    sys.stdout.flush()
 
     os.chdir(dir_build)
 
@@ -184,7 +196,9 @@ def main(args):
     if args.jenkins_exporter_git_ref != 'master':
         cmd.append('--github-exp-branch=%s' % args.jenkins_exporter_git_ref)
 
-    cmd.append('--build_clean')
+    if not incremental:
+        # incremental builds keep the build dir, so ninja rebuilds only what changed
+        cmd.append('--build_clean')
     cmd.append('--with_ge')
     cmd.append('--with_player')
     cmd.append('--with_collada')
@@ -212,6 +226,12 @@ def main(args):
     cmd.append('--gcc=gcc')
     cmd.append('--gxx=g++')
 
+    if args.jenkins_compiler_cache != 'none':
+        # The cache outlives the build dir, so clean builds still reuse objects
+        cmd.append('--compiler_cache=%s' % args.jenkins_compiler_cache)
+        cmd.append('--compiler_cache_dir=%s' % os.path.join(args.jenkins_perm_path, 'compiler-cache'))
+        cmd.append('--compiler_cache_size=%s' % args.jenkins_compiler_cache_size)
+
     cmd.append('--dir_install=%s' % os.path.join(args.jenkins_output, 'install', 'vray_for_blender'))
     cmd.append('--dir_release=%s' % os.path.join(args.jenkins_output, 'release', 'vray_for_blender'))
 
@@ -266,6 +286,28 @@ if __name__ == '__main__':
         required=False,
     )
 
+    parser.add_argument('--jenkins_git_jobs',
+        default=3,
+        type=int,
+        help='Number of repositories (and submodules of each) synced at the same time',
+    )
+
+    parser.add_argument('--jenkins_reset_mode',
+        choices=['full', 'incremental'],
+        default='full',
+        help='full - fresh Blender clone and clean build, incremental - keep the sources and the build dir',
+    )
+
+    parser.add_argument('--jenkins_compiler_cache',
+        choices=['none', 'auto', 'ccache', 'sccache'],
+        default='none',
+        help='Compiler cache kept in the perm path',
+    )
+
+    parser.add_argument('--jenkins_compiler_cache_size',
+        default='20G',
+    )
+
     parser.add_argument('--jenkins_build_type',
         choices=['debug', 'release'],
         default = 'release',